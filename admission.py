@@ -0,0 +1,81 @@
+# Admission control in front of the correction engine
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Generations allowed to run at once, and requests allowed to wait for a slot
+MAX_CONCURRENT = 2
+MAX_QUEUE = 8
+
+# Seconds each role may wait for a generation slot; 0 means fail fast
+ROLE_QUEUE_TIMEOUTS = {
+    'free': 0,
+    'user': 10.0,
+    'paid': 10.0,
+    'super': 30.0
+}
+
+class Overloaded(Exception):
+    """Raised when a request is turned away by admission control"""
+
+class AdmissionController:
+    """Bounds concurrent generations and the queue of requests waiting for one"""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def admit(self, timeout=None):
+        """Hold a generation slot for the duration of the block
+
+        Raises Overloaded straight away when the queue is full, or once timeout
+        seconds pass without a slot becoming free.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self.active >= self.max_concurrent:
+                if self.waiting >= self.max_queue or timeout == 0:
+                    self.rejected += 1
+                    raise Overloaded("Too many correction requests in progress")
+                self.waiting += 1
+                try:
+                    while self.active >= self.max_concurrent:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.rejected += 1
+                            raise Overloaded("Timed out waiting for a correction slot")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {'active': self.active, 'waiting': self.waiting, 'rejected': self.rejected}
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide admission controller"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+    return _controller
+
+def queue_timeout_for_role(role: str) -> float:
+    """Return how long a request from role may wait for a generation slot"""
+    return ROLE_QUEUE_TIMEOUTS.get(role, ROLE_QUEUE_TIMEOUTS['free'])
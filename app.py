@@ -1,19 +1,29 @@
 import streamlit as st
 import time
 from user_manager import (
-    signup, login, get_user, update_tokens, User, purchase_tokens, 
-    get_all_users, suspend_user, terminate_user, get_pending_complaints,
+    signup, login, get_user, get_user_by_id, charge, charge_penalty, credit, User, purchase_tokens, 
+    list_users, count_users, suspend_user, terminate_user, list_complaints, count_complaints,
     resolve_complaint, get_user_complaints, respond_to_complaint, submit_complaint,
-    get_complaint_details
+    DEFAULT_PAGE_SIZE, record_correction, get_user_statistics, get_daily_usage
 )
-from llm_utils import load_llm, correct_text, mask_blacklisted_words, highlight_corrections
+from llm_utils import (
+    iter_correct_segments, analyze_text, highlight_corrections, split_sentences, preprocess_text,
+    profile_for_role, plan_incremental_correction, join_sentences, MODEL_NAME
+)
+from inference_worker import get_worker, model_state
+from admission import get_admission_controller, queue_timeout_for_role, Overloaded
+from correction_cache import get_correction_cache
+from history_logger import get_history_logger
 from blacklist import get_blacklist, add_to_blacklist
 from collaboration import invite_user_to_collaborate, list_invitations_for_user, accept_invitation, reject_invitation, list_collaborations_for_user, get_user_collaborations
 from datetime import datetime
 
-# Load LLM once
-if 'llm' not in st.session_state:
-    st.session_state['llm'] = load_llm()
+# One model per process, shared by every session through the inference worker.
+# It loads in the background, so pages render while the model warms up.
+llm = get_worker(block=False)
+correction_cache = get_correction_cache()
+admission = get_admission_controller()
+history = get_history_logger()
 
 # Session state for user and cooldown
 if 'user' not in st.session_state:
@@ -23,12 +33,33 @@ if 'last_free_submit' not in st.session_state:
 
 st.sidebar.title("LLM Cooperative Editor")
 page = st.sidebar.radio("Select Role", ["Free User", "Paid User", "Super User"])
+if model_state() == 'warming':
+    st.sidebar.info("Model warming up...")
+elif model_state() == 'failed':
+    st.sidebar.error("Correction model failed to load.")
+
+def model_unavailable():
+    if llm is not None:
+        return False
+    if model_state() == 'failed':
+        st.error("The correction model failed to load. Please try again later.")
+    else:
+        st.warning("The correction model is still warming up. Please try again in a moment.")
+    return True
+
+# Refresh the session's user on every rerun, so balance and role changes made
+# elsewhere show up; served from the user cache after the first read
+if st.session_state['user'] is not None:
+    st.session_state['user'] = get_user_by_id(st.session_state['user'].id)
 
 # Top panel for stats
 def show_stats():
     user = st.session_state['user']
     if user:
-        st.markdown(f"Tokens: {user.tokens} | Role: {user.role}")
+        stats = get_user_statistics(user.id)
+        st.markdown(f"Tokens: {user.tokens} | Role: {user.role} | Corrections: {stats['total_corrections']} | "
+                    f"Tokens used: {stats['total_tokens_used']} | Penalties: {stats['penalties']} | "
+                    f"Bonuses: {stats['bonuses']}")
     else:
         st.markdown("Tokens: -- | Role: --")
 
@@ -37,6 +68,41 @@ st.markdown("### User Statistics")
 show_stats()
 st.markdown("---")
 
+# Correct text under admission control. Raises Overloaded when no generation
+# slot frees up within the role's queue timeout.
+def stream_correction(masked, role):
+    with admission.admit(queue_timeout_for_role(role)):
+        st.success("LLM Correction:")
+        return render_correction(masked, role)
+
+# Render the highlighted correction while sentences are still being corrected
+def render_correction(masked, role):
+    placeholder = st.empty()
+    profile, latency_budget = profile_for_role(role)
+    model_key = (getattr(llm, 'model_id', None) or MODEL_NAME, profile)
+    # On a resubmission only the sentences edited since the last correction are re-run
+    previous = st.session_state.get('last_correction')
+    if previous and previous[2] == model_key:
+        sentences, reused = plan_incremental_correction(previous[0], previous[1], masked)
+    else:
+        sentences, reused = split_sentences(preprocess_text(masked)), {}
+    unchanged = set()
+    last_render = 0
+    for i, sentence in iter_correct_segments(llm, sentences, reused, cache=correction_cache, profile=profile,
+                                             latency_budget=latency_budget, unchanged=unchanged):
+        sentences[i] = sentence
+        if time.time() - last_render > 0.2:
+            placeholder.write(highlight_corrections(masked, join_sentences(sentences)))
+            last_render = time.time()
+    corrected = join_sentences(sentences)
+    placeholder.write(highlight_corrections(masked, corrected))
+    # Sentences passed through uncorrected must not be reused as corrections
+    if unchanged:
+        st.session_state.pop('last_correction', None)
+    else:
+        st.session_state['last_correction'] = (masked, corrected, model_key)
+    return corrected
+
 # Free User Page
 def free_user_page():
     st.header("Free User Portal")
@@ -75,7 +141,8 @@ def free_user_page():
             st.rerun()
             return
             
-        word_count = len(text.strip().split())
+        analysis = analyze_text(text)
+        word_count = analysis.word_count
         if word_count > 20:
             st.session_state['free_user_error'] = f"Too many words! You entered {word_count} words. Maximum 20 words allowed. You will be logged out."
             st.session_state['last_free_submit'] = time.time()  # Set cooldown when exceeding word limit
@@ -83,11 +150,19 @@ def free_user_page():
             st.rerun()
             return
         
+        if model_unavailable():
+            return
+        
         st.session_state['last_free_submit'] = time.time()
-        masked = mask_blacklisted_words(text)
-        corrected = correct_text(st.session_state['llm'], masked)
-        st.success("LLM Correction:")
-        st.write(highlight_corrections(masked, corrected))
+        masked = analysis.masked
+        try:
+            corrected = stream_correction(masked, 'free')
+            record_correction(None, 'free')
+            history.log(None, masked, corrected, 'llm', 0)
+        except Overloaded:
+            # Free submissions are not queued when the engine is busy
+            st.warning("The correction service is busy, so your text was not corrected this time.")
+            st.write(masked)
         
         # Add logout button after successful submission
         if st.button("Logout"):
@@ -195,23 +270,22 @@ def paid_user_page():
         if not text.strip():
             st.error("Please enter some text or upload a file first!")
             return
+        if correction_mode == "LLM-correction" and model_unavailable():
+            return
             
-        word_count = len(text.strip().split())
-        user = get_user(st.session_state['user'].username)
+        analysis = analyze_text(text)
+        word_count = analysis.word_count
+        user = st.session_state['user']
         
-        # Check if user has enough tokens
-        if user.tokens < word_count:
-            penalty = user.tokens // 2
-            st.error(f"Not enough tokens! You need {word_count} tokens. {penalty} tokens will be deducted as penalty.")
-            update_tokens(user.id, -penalty)
-            st.session_state['user'] = get_user(user.username)
+        # Charge tokens for the word count, or half the balance as a penalty if it falls short
+        balance = charge(user.id, analysis.tokens_required, 'submission')
+        if balance is None:
+            penalty, user.tokens = charge_penalty(user.id, 'insufficient tokens')
+            st.error(f"Not enough tokens! You need {analysis.tokens_required} tokens. {penalty} tokens will be deducted as penalty.")
             st.rerun()
             return
-
-        # Charge tokens for the word count
-        update_tokens(user.id, -word_count)
-        st.session_state['user'] = get_user(user.username)
-        st.info(f"{word_count} tokens deducted for text submission. Remaining: {st.session_state['user'].tokens}")
+        user.tokens = balance
+        st.info(f"{analysis.tokens_required} tokens deducted for text submission. Remaining: {st.session_state['user'].tokens}")
 
         if correction_mode == "Self-correction":
             # Store original text for comparison
@@ -237,12 +311,13 @@ def paid_user_page():
                     
                     # Charge half the number of corrected words
                     tokens_to_charge = corrected_word_count // 2
-                    if st.session_state['user'].tokens < tokens_to_charge:
+                    balance = charge(user.id, tokens_to_charge, 'self-correction')
+                    if balance is None:
                         st.error(f"Not enough tokens for self-correction! You need {tokens_to_charge} tokens.")
                         return
-                    
-                    update_tokens(user.id, -tokens_to_charge)
-                    st.session_state['user'] = get_user(user.username)
+                    user.tokens = balance
+                    record_correction(user.id, user.role)
+                    history.log(user.id, st.session_state['original_text'], corrected_text, 'self', tokens_to_charge)
                     st.success("Self-corrected Text:")
                     st.write(corrected_text)
                     st.info(f"{tokens_to_charge} tokens deducted for self-correction ({corrected_word_count} words corrected). Remaining: {st.session_state['user'].tokens}")
@@ -253,41 +328,43 @@ def paid_user_page():
                     st.rerun()
         else:
             # LLM correction
-            masked = mask_blacklisted_words(text)
+            masked = analysis.masked
             # Charge tokens for blacklisted words
-            blacklisted_words = [w for w in text.split() if w.lower() in get_blacklist()]
-            if blacklisted_words:
-                blacklist_charge = sum(len(w) for w in blacklisted_words)
-                if st.session_state['user'].tokens < blacklist_charge:
+            blacklist_charge = analysis.blacklist_charge
+            if analysis.blacklisted_words:
+                balance = charge(user.id, blacklist_charge, 'blacklisted words')
+                if balance is None:
                     st.error(f"Not enough tokens for blacklisted words! You need {blacklist_charge} tokens.")
                     return
-                update_tokens(user.id, -blacklist_charge)
-                st.session_state['user'] = get_user(user.username)
+                user.tokens = balance
                 st.info(f"{blacklist_charge} tokens deducted for blacklisted words. Remaining: {st.session_state['user'].tokens}")
             
-            corrected = correct_text(st.session_state['llm'], masked)
+            try:
+                corrected = stream_correction(masked, user.role)
+                record_correction(user.id, user.role)
+                history.log(user.id, masked, corrected, 'llm', analysis.tokens_required + blacklist_charge)
+            except Overloaded:
+                # Nothing was corrected, so give back what this submission cost
+                user.tokens = credit(user.id, analysis.tokens_required + blacklist_charge, 'refund')
+                st.error("The correction service is busy right now. Your tokens were refunded, please try again shortly.")
+                return
             
             # Check if text has more than 10 words and no corrections were needed
-            word_count = len(text.strip().split())
             if word_count > 10 and corrected.lower() == masked.lower():
                 # Award bonus tokens for no corrections needed
-                update_tokens(user.id, 3)
-                st.session_state['user'] = get_user(user.username)
+                user.tokens = credit(user.id, 3, 'bonus')
                 st.success("No corrections needed! 3 bonus tokens awarded!")
             
-            st.success("LLM Correction:")
-            st.write(highlight_corrections(masked, corrected))
-            
             if corrected != masked:
                 st.subheader("Review Corrections")
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button("Accept Corrections"):
-                        if st.session_state['user'].tokens < 1:
+                        balance = charge(user.id, 1, 'accepted corrections')  # Charge 1 token for acceptance
+                        if balance is None:
                             st.error("Not enough tokens to accept corrections!")
                             return
-                        update_tokens(user.id, -1)  # Charge 1 token for acceptance
-                        st.session_state['user'] = get_user(user.username)
+                        user.tokens = balance
                         st.success("Corrections accepted! 1 token deducted.")
                         st.rerun()
                 with col2:
@@ -300,9 +377,9 @@ def paid_user_page():
 
     # Save to file option
     if text and st.button("Save to File"):
-        if st.session_state['user'].tokens >= 5:
-            update_tokens(st.session_state['user'].id, -5)
-            st.session_state['user'] = get_user(st.session_state['user'].username)
+        balance = charge(st.session_state['user'].id, 5, 'save to file')
+        if balance is not None:
+            st.session_state['user'].tokens = balance
             st.download_button(
                 label="Download corrected text",
                 data=corrected if 'corrected' in locals() else text,
@@ -347,6 +424,29 @@ def paid_user_page():
         st.session_state['user'] = None
         st.rerun()
 
+# Cursor stack for a paginated listing, the last entry being the current page's
+# cursor. It starts over whenever the listing's filters change.
+def page_cursors(name, filters):
+    state = st.session_state.get(name)
+    if state is None or state['filters'] != filters:
+        state = {'filters': filters, 'cursors': [None]}
+        st.session_state[name] = state
+    return state['cursors']
+
+def show_pager(name, cursors, next_cursor, total, page_size):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if len(cursors) > 1 and st.button("Previous", key=f"{name}_previous"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        pages = max(1, -(-total // page_size))
+        st.write(f"Page {len(cursors)} of {pages} ({total} total)")
+    with col3:
+        if next_cursor is not None and st.button("Next", key=f"{name}_next"):
+            cursors.append(next_cursor)
+            st.rerun()
+
 # Super User Page
 def super_user_page():
     st.header("Super User Portal")
@@ -367,7 +467,7 @@ def super_user_page():
     st.info(f"Welcome, Super User {st.session_state['user'].username}!")
     
     # Create tabs for different super user functions
-    tab1, tab2, tab3 = st.tabs(["Blacklist Management", "User Management", "Complaints"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Blacklist Management", "User Management", "Complaints", "Usage"])
     
     with tab1:
         st.subheader("Blacklist Management")
@@ -381,7 +481,15 @@ def super_user_page():
     
     with tab2:
         st.subheader("User Management")
-        users = get_all_users()
+        col1, col2 = st.columns(2)
+        with col1:
+            role_filter = st.selectbox("Role", ["All", "free", "user", "paid", "super", "suspended", "terminated"],
+                                       key="users_role")
+        with col2:
+            users_page_size = st.selectbox("Users per page", [DEFAULT_PAGE_SIZE, 50, 100], key="users_page_size")
+        role = None if role_filter == "All" else role_filter
+        cursors = page_cursors('users_pages', (role, users_page_size))
+        users, next_cursor = list_users(role, cursors[-1], users_page_size)
         for user in users:
             with st.expander(f"User: {user['username']} (Role: {user['role']})"):
                 st.write(f"Current tokens: {user['tokens']}")
@@ -393,20 +501,28 @@ def super_user_page():
                         terminate_user(user['id'])
                         st.success(f"User {user['username']} has been terminated and can no longer log in.")
                         st.rerun()
+        show_pager('users_pages', cursors, next_cursor, count_users(role), users_page_size)
     
     with tab3:
         st.subheader("Complaints Management")
-        complaints = get_pending_complaints()
+        col1, col2 = st.columns(2)
+        with col1:
+            status = st.selectbox("Status", ["pending", "resolved"], key="complaints_status")
+        with col2:
+            complaints_page_size = st.selectbox("Complaints per page", [DEFAULT_PAGE_SIZE, 50, 100],
+                                                key="complaints_page_size")
+        cursors = page_cursors('complaints_pages', (status, complaints_page_size))
+        complaints, next_cursor = list_complaints(status, cursors[-1], complaints_page_size)
         for complaint in complaints:
             with st.expander(f"Complaint from {complaint['complainer_username']} against {complaint['complained_username']}"):
                 st.write("Reason:", complaint['reason'])
                 st.write("Created at:", datetime.fromtimestamp(complaint['created_at']).strftime('%Y-%m-%d %H:%M:%S'))
                 
-                # Get the full complaint details including response
-                complaint_details = get_complaint_details(complaint['id'])
-                if complaint_details and complaint_details.get('response'):
-                    st.write("Response:", complaint_details['response'])
-                    st.write("Responded at:", datetime.fromtimestamp(complaint_details['responded_at']).strftime('%Y-%m-%d %H:%M:%S'))
+                if complaint['status'] == 'resolved':
+                    st.write("Action taken:", complaint['action_taken'])
+                elif complaint['response']:
+                    st.write("Response:", complaint['response'])
+                    st.write("Responded at:", datetime.fromtimestamp(complaint['responded_at']).strftime('%Y-%m-%d %H:%M:%S'))
                     
                     if st.button("Resolve", key=f"resolve_{complaint['id']}"):
                         action = st.selectbox("Action", ["Warning", "Token Penalty"], key=f"action_{complaint['id']}")
@@ -429,6 +545,16 @@ def super_user_page():
                                 st.error("Failed to resolve complaint")
                 else:
                     st.warning("Waiting for response from the complained user")
+        show_pager('complaints_pages', cursors, next_cursor, count_complaints(status), complaints_page_size)
+    
+    with tab4:
+        st.subheader("Daily Usage")
+        days = st.selectbox("Days", [7, 30, 90], key="usage_days")
+        usage = get_daily_usage(days)
+        if usage:
+            st.table(usage)
+        else:
+            st.info("No usage recorded yet.")
 
     if st.button("Logout (Super User)"):
         st.session_state['user'] = None
@@ -0,0 +1,138 @@
+# Micro-benchmarks for the text processing functions in llm_utils
+
+import argparse
+import random
+import resource
+import statistics
+import time
+from llm_utils import (
+    load_llm, correct_text, mask_blacklisted_words, highlight_corrections, split_sentences,
+    preprocess_text, BACKENDS
+)
+from blacklist import BlacklistMatcher
+
+DEFAULT_SIZES = [20, 200, 2000, 10000, 50000]
+# Wildcard patterns per matcher in the masking cases below
+DEFAULT_WILDCARD_PATTERNS = 100000
+# Pattern shapes that defeat an index on the literal prefix alone: no prefix at
+# all, or one short prefix shared by every pattern
+WILDCARD_SHAPES = {
+    'mask_leading_wildcards': '*x{n}y',
+    'mask_shared_prefix': 's*x{n}y'
+}
+VOCABULARY = [
+    'the', 'a', 'student', 'teacher', 'write', 'writes', 'wrote', 'essay', 'i', 'he', 'she', 'they',
+    'is', 'are', 'was', 'were', 'good', 'bad', 'quickly', 'yesterday', 'school', 'book', 'read',
+    'have', 'has', 'go', 'goes', 'went', 'to', 'in', 'on', 'and', 'but', 'because', 'badword1'
+]
+
+class StubTokenizer:
+    """Whitespace tokenizer with the call signature llm_utils uses"""
+
+    def __call__(self, texts, add_special_tokens=True):
+        return {'input_ids': [text.split() for text in texts]}
+
+class StubModel:
+    """Deterministic stand-in for the text2text pipeline, so no model is downloaded"""
+
+    def __init__(self, delay_per_prompt=0.0):
+        self.tokenizer = StubTokenizer()
+        self.model_id = 'stub'
+        self.delay_per_prompt = delay_per_prompt
+
+    def __call__(self, prompts, **generate_kwargs):
+        if self.delay_per_prompt:
+            time.sleep(self.delay_per_prompt * len(prompts))
+        results = []
+        for prompt in prompts:
+            text = prompt[len('grammar: '):]
+            words = [word if word != 'i' else 'I' for word in text.split()]
+            results.append({'generated_text': ' '.join(words).capitalize()})
+        return results
+
+def make_corpus(word_count: int, seed: int = 0) -> str:
+    """Build a deterministic text of word_count words in sentences of 5 to 25 words"""
+    rng = random.Random(seed)
+    sentences = []
+    remaining = word_count
+    while remaining > 0:
+        length = min(remaining, rng.randint(5, 25))
+        sentences.append(' '.join(rng.choice(VOCABULARY) for _ in range(length)) + '.')
+        remaining -= length
+    return ' '.join(sentences)
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(func, repeats: int) -> list:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def percentile(timings: list, fraction: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def wildcard_matcher(shape: str, count: int) -> BlacklistMatcher:
+    """Build a matcher of count patterns of a shape such as '*x{n}y'"""
+    return BlacklistMatcher([shape.format(n=n) for n in range(count)])
+
+def run_benchmarks(llm, sizes: list, repeats: int, wildcard_patterns: int = DEFAULT_WILDCARD_PATTERNS) -> list:
+    """Time correct_text, mask_blacklisted_words and highlight_corrections on each corpus size
+
+    Each WILDCARD_SHAPES case masks the same text against wildcard_patterns
+    patterns of its shape.
+    """
+    matchers = {name: wildcard_matcher(shape, wildcard_patterns) for name, shape in WILDCARD_SHAPES.items()}
+    rows = []
+    for size in sizes:
+        text = make_corpus(size)
+        sentences = len(split_sentences(preprocess_text(text)))
+        corrected = correct_text(llm, text)
+        cases = [
+            ('correct_text', lambda: correct_text(llm, text)),
+            ('mask_blacklisted_words', lambda: mask_blacklisted_words(text)),
+            ('highlight_corrections', lambda: highlight_corrections(text, corrected))
+        ]
+        cases[2:2] = [(name, lambda matcher=matcher: matcher.mask(text)) for name, matcher in matchers.items()]
+        for name, func in cases:
+            timings = measure(func, repeats)
+            p50 = statistics.median(timings)
+            rows.append({
+                'function': name,
+                'words': size,
+                'p50_ms': p50 * 1000,
+                'p95_ms': percentile(timings, 0.95) * 1000,
+                'sentences_per_s': sentences / p50 if p50 else float('inf'),
+                'peak_rss_mb': peak_rss_mb()
+            })
+    return rows
+
+def print_report(rows: list):
+    print(f"{'function':<24}{'words':>8}{'p50 ms':>12}{'p95 ms':>12}{'sent/s':>12}{'peak MB':>10}")
+    for row in rows:
+        print(f"{row['function']:<24}{row['words']:>8}{row['p50_ms']:>12.2f}{row['p95_ms']:>12.2f}"
+              f"{row['sentences_per_s']:>12.1f}{row['peak_rss_mb']:>10.1f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the text processing functions in llm_utils")
+    parser.add_argument('--real', action='store_true', help="use the real model instead of the stub")
+    parser.add_argument('--backend', choices=BACKENDS, default='fp32', help="model backend for --real")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="corpus sizes in words")
+    parser.add_argument('--repeats', type=int, default=5, help="timed runs per function and size")
+    parser.add_argument('--wildcard-patterns', type=int, default=DEFAULT_WILDCARD_PATTERNS,
+                        help="patterns per wildcard masking case")
+    parser.add_argument('--stub-delay', type=float, default=0.0, help="simulated seconds per prompt for the stub")
+    args = parser.parse_args()
+
+    if args.real:
+        llm = load_llm(args.backend)
+        if llm is None:
+            raise SystemExit("Could not load the model")
+    else:
+        llm = StubModel(args.stub_delay)
+    print_report(run_benchmarks(llm, args.sizes, args.repeats, args.wildcard_patterns))
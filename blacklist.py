@@ -1,50 +1,184 @@
+import csv
+import itertools
+import re
 import sqlite3
-
-def init_blacklist_tables():
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
-    
-    # Create blacklist table
-    c.execute('''CREATE TABLE IF NOT EXISTS blacklist (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        word TEXT UNIQUE NOT NULL,
-        added_by INTEGER,
-        added_at REAL DEFAULT (strftime('%s', 'now')),
-        status TEXT DEFAULT 'active',
-        FOREIGN KEY (added_by) REFERENCES users (id)
-    )''')
-    
-    conn.commit()
-    conn.close()
+import threading
+from db import get_connection
 
 def get_blacklist():
-    conn = sqlite3.connect('llm_editor.db')
+    conn = get_connection()
     c = conn.cursor()
     c.execute('SELECT word FROM blacklist WHERE status = "active"')
     words = [row[0] for row in c.fetchall()]
-    conn.close()
     return words
 
+def normalize_entry(entry: str) -> str:
+    """Lowercase a blacklist entry and collapse its whitespace; '' means there is nothing to add"""
+    return ' '.join(entry.lower().split())
+
 def add_to_blacklist(word, user_id=None):
-    conn = sqlite3.connect('llm_editor.db')
+    conn = get_connection()
     c = conn.cursor()
     try:
         c.execute('INSERT INTO blacklist (word, added_by) VALUES (?, ?)',
-                 (word.lower(), user_id))
+                 (normalize_entry(word), user_id))
         conn.commit()
         return True
     except sqlite3.IntegrityError:
+        conn.rollback()
         return False
-    finally:
-        conn.close()
 
 def is_blacklisted(word):
-    conn = sqlite3.connect('llm_editor.db')
+    # Same answer mask_blacklisted_words gives, wildcard patterns included
+    return get_matcher().match([word])[0]
+
+WILDCARDS = ('*', '?')
+
+def entry_kind(entry: str) -> str:
+    """Classify a blacklist entry as a 'word', a multi-word 'phrase' or a wildcard 'pattern'"""
+    if len(entry.split()) > 1:
+        return 'phrase'
+    if any(wildcard in entry for wildcard in WILDCARDS):
+        return 'pattern'
+    return 'word'
+
+def wildcard_to_regex(pattern: str) -> str:
+    # '*' matches any run of characters and '?' a single character within a word
+    return ''.join('.*' if ch == '*' else '.' if ch == '?' else re.escape(ch) for ch in pattern)
+
+class BlacklistMatcher:
+    """Blacklisted words, phrases and patterns compiled for masking a whole text in one pass"""
+
+    def __init__(self, entries):
+        entries = [entry.lower() for entry in entries]
+        self.words = frozenset(entry.strip() for entry in entries if entry_kind(entry) == 'word')
+        # Phrases indexed by their first word, longest first
+        self.phrases = {}
+        for entry in entries:
+            if entry_kind(entry) == 'phrase':
+                words = tuple(entry.split())
+                self.phrases.setdefault(words[0], []).append(words)
+        for candidates in self.phrases.values():
+            candidates.sort(key=len, reverse=True)
+        # Patterns grouped by their literal prefix and suffix, then by the longest
+        # literal between them, so a word is only tested against patterns whose
+        # literals it contains. Each group is compiled into one regex the first
+        # time a word reaches it.
+        grouped = {}
+        for entry in entries:
+            if entry_kind(entry) == 'pattern':
+                entry = entry.strip()
+                literals = re.split(r'[*?]+', entry)
+                middle = max(literals[1:-1], key=len, default='')
+                middles = grouped.setdefault((literals[0], literals[-1]), {})
+                middles.setdefault(middle, []).append(wildcard_to_regex(entry))
+        # (prefix, suffix) -> (distinct middle lengths, {middle: regex source or compiled regex})
+        self.patterns = {
+            ends: (sorted({len(middle) for middle in middles}),
+                   {middle: '|'.join(regexes) for middle, regexes in middles.items()})
+            for ends, middles in grouped.items()
+        }
+        self.prefix_lengths = sorted({len(prefix) for prefix, _ in self.patterns})
+        self.suffix_lengths = sorted({len(suffix) for _, suffix in self.patterns})
+
+    def matches_pattern(self, word: str) -> bool:
+        for prefix_length in self.prefix_lengths:
+            for suffix_length in self.suffix_lengths:
+                if prefix_length + suffix_length > len(word):
+                    break
+                group = self.patterns.get((word[:prefix_length], word[len(word) - suffix_length:]))
+                if group is None:
+                    continue
+                middle_lengths, regexes = group
+                inner = word[prefix_length:len(word) - suffix_length]
+                for length in middle_lengths:
+                    if length > len(inner):
+                        break
+                    middles = {inner[start:start + length] for start in range(len(inner) - length + 1)}
+                    for middle in middles:
+                        regex = regexes.get(middle)
+                        if regex is None:
+                            continue
+                        if isinstance(regex, str):
+                            regex = regexes[middle] = re.compile(regex)
+                        if regex.fullmatch(word):
+                            return True
+        return False
+
+    def match(self, words: list) -> list:
+        """Return a flag per word telling whether it is part of a blacklisted entry"""
+        lowered = [word.lower() for word in words]
+        flags = [False] * len(words)
+        for i, word in enumerate(lowered):
+            if word in self.words or (self.patterns and self.matches_pattern(word)):
+                flags[i] = True
+            for phrase in self.phrases.get(word, ()):
+                if tuple(lowered[i:i + len(phrase)]) == phrase:
+                    flags[i:i + len(phrase)] = [True] * len(phrase)
+                    break
+        return flags
+
+    def mask(self, text: str) -> str:
+        words = text.split()
+        return ' '.join('*' * len(word) if flagged else word
+                        for word, flagged in zip(words, self.match(words)))
+
+def import_blacklist_csv(path, user_id=None, batch_size=5000):
+    """Load words, phrases and wildcard patterns from the 'word' column of a CSV
+
+    Rows are streamed in batches of executemany inserts inside one transaction;
+    entries already on the blacklist are skipped. Returns the number added.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    added = 0
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            entries = (normalize_entry(row['word']) for row in csv.DictReader(f))
+            rows = ((entry, user_id) for entry in entries if entry)
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                c.executemany('INSERT OR IGNORE INTO blacklist (word, added_by) VALUES (?, ?)', batch)
+                added += c.rowcount
+        conn.commit()
+        return added
+    except Exception:
+        conn.rollback()
+        raise
+
+def export_blacklist_csv(path):
+    """Write the active blacklist to a CSV with the same id,word layout the importer reads"""
+    conn = get_connection()
     c = conn.cursor()
-    c.execute('SELECT 1 FROM blacklist WHERE word = ? AND status = "active"', (word.lower(),))
-    result = c.fetchone() is not None
-    conn.close()
-    return result
+    c.execute('SELECT id, word FROM blacklist WHERE status = "active" ORDER BY id')
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'word'])
+        while True:
+            rows = c.fetchmany(5000)
+            if not rows:
+                break
+            writer.writerows(rows)
+
+def get_blacklist_version():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT version FROM blacklist_version WHERE id = 1')
+    row = c.fetchone()
+    return row[0] if row else 0
+
+_matcher = None
+_matcher_version = None
+_matcher_lock = threading.Lock()
 
-# Initialize tables
-init_blacklist_tables() 
\ No newline at end of file
+def get_matcher() -> BlacklistMatcher:
+    """Return the compiled matcher, rebuilding it only when the blacklist version changes"""
+    global _matcher, _matcher_version
+    version = get_blacklist_version()
+    with _matcher_lock:
+        if _matcher is None or version != _matcher_version:
+            _matcher = BlacklistMatcher(get_blacklist())
+            _matcher_version = version
+        return _matcher
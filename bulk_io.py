@@ -0,0 +1,203 @@
+# Streaming bulk import and export of the users, complaints and blacklist CSVs
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+import db
+from blacklist import normalize_entry
+
+DEFAULT_BATCH_SIZE = 5000
+# Seconds between progress lines
+REPORT_INTERVAL = 2.0
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def to_int(value, default=None):
+    return int(value) if value not in (None, '') else default
+
+def to_epoch(value):
+    return time.mktime(time.strptime(value, DATETIME_FORMAT)) if value else None
+
+def from_epoch(value) -> str:
+    return time.strftime(DATETIME_FORMAT, time.localtime(value)) if value is not None else ''
+
+def parse_user(row) -> tuple:
+    return (to_int(row['id']), row['username'], row['password'], row['role'] or 'user', to_int(row['tokens'], 0))
+
+def parse_complaint(row) -> tuple:
+    return (to_int(row['id']), to_int(row['complainer_id']), to_int(row['complained_id']), row['reason'],
+            row['status'] or 'pending', to_epoch(row['created_at']) or time.time(), to_epoch(row['resolved_at']),
+            row['action_taken'] or None, to_int(row['penalty_tokens'], 0))
+
+def format_complaint(row) -> tuple:
+    return row[:5] + (from_epoch(row[5]), from_epoch(row[6])) + row[7:]
+
+def parse_blacklist_entry(row) -> tuple:
+    # Blank entries are skipped
+    entry = normalize_entry(row['word'])
+    return (to_int(row['id']), entry) if entry else None
+
+# CSV layout of each table, and how rows are converted on the way in and out
+TABLES = {
+    'users': {
+        'columns': ['id', 'username', 'password', 'role', 'tokens'],
+        'parse': parse_user
+    },
+    'complaints': {
+        'columns': ['id', 'complainer_id', 'complained_id', 'reason', 'status', 'created_at', 'resolved_at',
+                    'action_taken', 'penalty_tokens'],
+        'parse': parse_complaint,
+        'format': format_complaint
+    },
+    'blacklist': {
+        'columns': ['id', 'word'],
+        'parse': parse_blacklist_entry,
+        'where': "status = 'active'"
+    }
+}
+
+class RateReporter:
+    """Prints rows and rows per second at most every REPORT_INTERVAL seconds, and once at the end"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.rows = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def add(self, rows: int):
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self._last_report >= REPORT_INTERVAL:
+            self._last_report = now
+            self.report()
+
+    def report(self, final=False):
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed else 0.0
+        print(f"{self.label}: {self.rows} rows{' done' if final else ''}, {rate:,.0f} rows/s")
+
+def drop_indexes(conn, table: str) -> list:
+    """Drop the table's secondary indexes and return the statements that recreate them"""
+    indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                           (table,)).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+def rebuild_indexes(conn, statements: list):
+    for sql in statements:
+        # sqlite_master keeps the statement without IF NOT EXISTS
+        conn.execute(sql.replace('INDEX', 'INDEX IF NOT EXISTS', 1))
+
+def import_csv(table: str, path: str, batch_size=DEFAULT_BATCH_SIZE, restart=False, db_path=None) -> int:
+    """Stream a CSV into table in batches and return the number of rows inserted
+
+    Each batch is one transaction that also records how many CSV rows are done,
+    so after a failure the next run resumes at the failed batch (restart=True
+    starts over). Rows whose id or unique key already exists are skipped. The
+    table's secondary indexes are dropped for the import and rebuilt at the end,
+    also when it fails.
+    """
+    spec = TABLES[table]
+    source = os.path.abspath(path)
+    conn = db.connect(db_path or db.DB_FILE, isolation_level=None)
+    placeholders = ', '.join('?' for _ in spec['columns'])
+    insert = f"INSERT OR IGNORE INTO {table} ({', '.join(spec['columns'])}) VALUES ({placeholders})"
+
+    conn.execute('BEGIN IMMEDIATE')
+    progress = conn.execute('SELECT rows_done, dropped_indexes FROM bulk_import_progress WHERE table_name = ? AND source = ?',
+                            (table, source)).fetchone()
+    rows_done = progress[0] if progress and not restart else 0
+    # Indexes left dropped by a run that crashed are still owed a rebuild
+    dropped = json.loads(progress[1]) if progress and progress[1] else []
+    dropped += drop_indexes(conn, table)
+    conn.execute('''INSERT OR REPLACE INTO bulk_import_progress (table_name, source, rows_done, dropped_indexes, updated_at)
+                    VALUES (?, ?, ?, ?, ?)''', (table, source, rows_done, json.dumps(dropped), time.time()))
+    conn.execute('COMMIT')
+    if rows_done:
+        print(f"Resuming {table} import after row {rows_done}")
+
+    reporter = RateReporter(f"import {table}")
+    inserted = 0
+    finished = False
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for _ in itertools.islice(reader, rows_done):
+                pass
+            while True:
+                batch = list(itertools.islice(reader, batch_size))
+                if not batch:
+                    break
+                rows = [parsed for parsed in map(spec['parse'], batch) if parsed is not None]
+                conn.execute('BEGIN IMMEDIATE')
+                inserted += conn.executemany(insert, rows).rowcount
+                conn.execute('''UPDATE bulk_import_progress SET rows_done = rows_done + ?, updated_at = ?
+                                WHERE table_name = ? AND source = ?''', (len(batch), time.time(), table, source))
+                conn.execute('COMMIT')
+                rows_done += len(batch)
+                reporter.add(len(batch))
+        finished = True
+    except Exception as e:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        print(f"Batch after row {rows_done} of {path} failed: {e}. Run the import again to resume from it.")
+        raise
+    finally:
+        start = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        rebuild_indexes(conn, dropped)
+        if finished:
+            conn.execute('DELETE FROM bulk_import_progress WHERE table_name = ? AND source = ?', (table, source))
+        else:
+            conn.execute('UPDATE bulk_import_progress SET dropped_indexes = NULL WHERE table_name = ? AND source = ?',
+                         (table, source))
+        conn.execute('COMMIT')
+        conn.close()
+        if dropped:
+            print(f"Rebuilt {len(dropped)} indexes on {table} in {time.perf_counter() - start:.1f} s")
+    reporter.report(final=True)
+    print(f"{inserted} rows inserted, {reporter.rows - inserted} skipped")
+    return inserted
+
+def export_csv(table: str, path: str, batch_size=DEFAULT_BATCH_SIZE, db_path=None) -> int:
+    """Stream table into a CSV with the layout import_csv reads and return the number of rows"""
+    spec = TABLES[table]
+    conn = db.connect(db_path or db.DB_FILE)
+    where = f"WHERE {spec['where']}" if 'where' in spec else ''
+    cursor = conn.execute(f"SELECT {', '.join(spec['columns'])} FROM {table} {where} ORDER BY id")
+    format_row = spec.get('format')
+    reporter = RateReporter(f"export {table}")
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(spec['columns'])
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            writer.writerows(map(format_row, rows) if format_row else rows)
+            reporter.add(len(rows))
+    conn.close()
+    reporter.report(final=True)
+    return reporter.rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk import and export of the users, complaints and blacklist CSVs")
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('table', choices=sorted(TABLES))
+    parser.add_argument('path', help="CSV file to read or write")
+    parser.add_argument('--db', default=db.DB_FILE, help="database file")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="rows per batch")
+    parser.add_argument('--restart', action='store_true', help="ignore the progress of an earlier failed import")
+    args = parser.parse_args()
+
+    if args.action == 'import':
+        try:
+            import_csv(args.table, args.path, args.batch_size, args.restart, args.db)
+        except Exception:
+            raise SystemExit(1)
+    else:
+        export_csv(args.table, args.path, args.batch_size, args.db)
@@ -0,0 +1,186 @@
+# Query plan and latency checks for the data layer on a large synthetic database
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import db
+import user_manager
+import collaboration
+
+DEFAULT_DB = 'query_plans.db'
+DEFAULT_USERS = 1000000
+DEFAULT_COMPLAINTS = 2000000
+DEFAULT_INVITATIONS = 2000000
+DEFAULT_BUDGET_MS = 50.0
+
+def build_database(path: str, users: int, complaints: int, invitations: int):
+    """Create a synthetic database at path with the given row counts
+
+    About 1% of complaints are pending, and 60% of invitations are accepted,
+    each with a collaboration.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = db.connect(path)
+    now = time.time()
+    with conn:
+        conn.execute('''WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+                        INSERT INTO users (id, username, password, role, tokens, last_login)
+                        SELECT n, 'user' || n, 'pw',
+                               CASE n % 10 WHEN 0 THEN 'super' WHEN 1 THEN 'free' WHEN 2 THEN 'free' ELSE 'paid' END,
+                               n % 500, ? - n
+                        FROM seq''', (users, now))
+        conn.execute('''WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+                        INSERT INTO complaints (complainer_id, complained_id, reason, status, created_at)
+                        SELECT abs(random()) % ? + 1, abs(random()) % ? + 1, 'synthetic complaint',
+                               CASE WHEN n % 100 = 0 THEN 'pending' ELSE 'resolved' END, ? - n
+                        FROM seq''', (complaints, users, users, now))
+        conn.execute('''WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+                        INSERT INTO collaboration_invitations (inviter_id, invitee_id, text, status, created_at)
+                        SELECT abs(random()) % ? + 1, abs(random()) % ? + 1, 'synthetic text',
+                               CASE WHEN n % 20 = 0 THEN 'pending' WHEN n % 10 < 6 THEN 'accepted' ELSE 'rejected' END,
+                               ? - n
+                        FROM seq''', (invitations, users, users, now))
+        conn.execute('''INSERT INTO collaborations (invitation_id, text, last_edited_by, last_edited_at)
+                        SELECT id, text, invitee_id, created_at FROM collaboration_invitations
+                        WHERE status = 'accepted' ''')
+        conn.execute('''WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+                        INSERT INTO rejected_corrections (user_id, original_text, rejected_correction, reason, status,
+                                                          review_timestamp)
+                        SELECT abs(random()) % ? + 1, 'original', 'correction', 'synthetic',
+                               CASE WHEN n % 100 = 0 THEN 'pending' ELSE 'reviewed' END, ? - n
+                        FROM seq''', (complaints, users, now))
+    conn.execute('ANALYZE')
+    conn.close()
+
+def pick_probes(path: str) -> dict:
+    """Pick ids that exercise each query with a realistic amount of data"""
+    conn = db.connect(path)
+    probes = {
+        'complained_id': conn.execute("SELECT complained_id FROM complaints WHERE status = 'pending' LIMIT 1").fetchone()[0],
+        'complaint_id': conn.execute("SELECT id FROM complaints WHERE status = 'pending' LIMIT 1").fetchone()[0],
+        'complaint_cursor': conn.execute('''SELECT created_at, id FROM complaints WHERE status = 'pending'
+                                            ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET 1000''').fetchone(),
+        'invitee_id': conn.execute("SELECT invitee_id FROM collaboration_invitations WHERE status = 'pending' LIMIT 1").fetchone()[0],
+        'collaborator_id': conn.execute('''SELECT i.inviter_id FROM collaborations c
+                                           JOIN collaboration_invitations i ON c.invitation_id = i.id LIMIT 1''').fetchone()[0]
+    }
+    conn.close()
+    return probes
+
+def query_cases(probes: dict) -> list:
+    """Return (name, call, bounded) for every read query in user_manager and collaboration
+
+    Unbounded queries return every matching row, so only their plans are checked;
+    bounded ones must also stay within the latency budget.
+    """
+    def username(user_id):
+        return f'user{user_id}'
+    def get_user_uncached():
+        # Drop user1 from the user cache so every run reads the database
+        user_manager.invalidate_user(1)
+        return user_manager.get_user('user1')
+    return [
+        ('login', lambda: user_manager.login('user1', 'pw'), True),
+        ('get_user', get_user_uncached, True),
+        ('get_user_statistics', lambda: user_manager.get_user_statistics(1), True),
+        ('get_daily_usage', lambda: user_manager.get_daily_usage(30), True),
+        ('get_all_users', lambda: user_manager.get_all_users(), False),
+        ('list_users', lambda: user_manager.list_users(), True),
+        ('list_users by role after cursor', lambda: user_manager.list_users('free', 'user5'), True),
+        ('count_users', lambda: user_manager.count_users(), True),
+        ('count_users by role', lambda: user_manager.count_users('paid'), True),
+        ('get_pending_complaints', lambda: user_manager.get_pending_complaints(), False),
+        ('list_complaints', lambda: user_manager.list_complaints(), True),
+        ('list_complaints after cursor', lambda: user_manager.list_complaints(after=probes['complaint_cursor']), True),
+        ('count_complaints', lambda: user_manager.count_complaints(), True),
+        ('get_user_complaints', lambda: user_manager.get_user_complaints(probes['complained_id']), True),
+        ('get_complaint_details', lambda: user_manager.get_complaint_details(probes['complaint_id']), True),
+        ('get_pending_rejected_corrections', lambda: user_manager.get_pending_rejected_corrections(), False),
+        ('list_invitations_for_user',
+         lambda: collaboration.list_invitations_for_user(username(probes['invitee_id'])), True),
+        ('list_collaborations_for_user',
+         lambda: collaboration.list_collaborations_for_user(username(probes['collaborator_id'])), True),
+        ('get_user_collaborations', lambda: collaboration.get_user_collaborations(probes['collaborator_id']), True)
+    ]
+
+def capture_queries(call) -> list:
+    """Run call once and return the SELECT statements it sent to the database"""
+    statements = []
+    def trace(sql):
+        if sql.lstrip().upper().startswith('SELECT'):
+            statements.append(sql)
+    conn = db.get_connection()
+    conn.set_trace_callback(trace)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    return statements
+
+# Queries that read a whole table on purpose; count_users sums one row per role
+ALLOWED_SCANS = {'get_all_users', 'count_users'}
+
+def full_scans(sql: str) -> list:
+    """Return the plan steps of sql that read a whole table or index
+
+    Walking an index in order under a LIMIT stops early, so it is not counted.
+    """
+    plan = db.get_connection().execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+    limited = ' LIMIT ' in ' '.join(sql.upper().split())
+    return [row[3] for row in plan
+            if row[3].startswith('SCAN') and row[3] != 'SCAN CONSTANT ROW'
+            and not (limited and 'USING' in row[3] and 'INDEX' in row[3])]
+
+def check_queries(repeats: int, budget_ms: float) -> list:
+    """Check every case and return one result row per case"""
+    rows = []
+    for name, call, bounded in query_cases(pick_probes(db.DB_FILE)):
+        scans = []
+        for sql in capture_queries(call):
+            scans.extend(full_scans(sql))
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - start)
+        p50_ms = statistics.median(timings) * 1000
+        problems = []
+        if scans and name not in ALLOWED_SCANS:
+            problems.append('full scan: ' + '; '.join(scans))
+        if bounded and p50_ms > budget_ms:
+            problems.append(f'over budget ({budget_ms:.0f} ms)')
+        rows.append({'query': name, 'p50_ms': p50_ms, 'problems': problems})
+    return rows
+
+def print_report(rows: list):
+    print(f"{'query':<36}{'p50 ms':>10}  result")
+    for row in rows:
+        result = '; '.join(row['problems']) if row['problems'] else 'ok'
+        print(f"{row['query']:<36}{row['p50_ms']:>10.2f}  {result}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check query plans and latency on a large synthetic database")
+    parser.add_argument('--db', default=DEFAULT_DB, help="synthetic database path, reused if it already exists")
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the synthetic database")
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+    parser.add_argument('--complaints', type=int, default=DEFAULT_COMPLAINTS)
+    parser.add_argument('--invitations', type=int, default=DEFAULT_INVITATIONS)
+    parser.add_argument('--repeats', type=int, default=5, help="timed runs per query")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help="p50 latency budget per query")
+    args = parser.parse_args()
+
+    if args.rebuild or not os.path.exists(args.db):
+        start = time.perf_counter()
+        build_database(args.db, args.users, args.complaints, args.invitations)
+        print(f"Built {args.db} in {time.perf_counter() - start:.1f} s")
+
+    # Point every data-layer function at the synthetic database
+    db.DB_FILE = args.db
+
+    rows = check_queries(args.repeats, args.budget_ms)
+    print_report(rows)
+    if any(row['problems'] for row in rows):
+        sys.exit(1)
@@ -1,43 +1,13 @@
 # Collaboration features for paid users
 
 import streamlit as st
-import sqlite3
 from datetime import datetime
 import time
-from user_manager import get_user, update_tokens
+from user_manager import get_user, apply_token_change, invalidate_user
+from db import get_connection, get_writer
 
 def get_db():
-    return sqlite3.connect('llm_editor.db')
-
-def init_collaboration_tables():
-    conn = get_db()
-    c = conn.cursor()
-    
-    # Table for collaboration invitations
-    c.execute('''CREATE TABLE IF NOT EXISTS collaboration_invitations (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        inviter_id INTEGER,
-        invitee_id INTEGER,
-        text TEXT,
-        status TEXT DEFAULT 'pending',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (inviter_id) REFERENCES users (id),
-        FOREIGN KEY (invitee_id) REFERENCES users (id)
-    )''')
-    
-    # Table for active collaborations
-    c.execute('''CREATE TABLE IF NOT EXISTS collaborations (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        invitation_id INTEGER,
-        text TEXT,
-        last_edited_by INTEGER,
-        last_edited_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (invitation_id) REFERENCES collaboration_invitations (id),
-        FOREIGN KEY (last_edited_by) REFERENCES users (id)
-    )''')
-    
-    conn.commit()
-    conn.close()
+    return get_connection()
 
 def invite_user_to_collaborate(inviter_username: str, invitee_username: str, text: str) -> bool:
     inviter = get_user(inviter_username)
@@ -49,21 +19,15 @@ def invite_user_to_collaborate(inviter_username: str, invitee_username: str, tex
     if invitee.role != 'paid':
         return False
     
-    conn = get_db()
-    c = conn.cursor()
-    
     try:
-        c.execute('''INSERT INTO collaboration_invitations 
-                     (inviter_id, invitee_id, text)
-                     VALUES (?, ?, ?)''',
-                  (inviter.id, invitee.id, text))
-        conn.commit()
+        get_writer().execute('''INSERT INTO collaboration_invitations 
+                                (inviter_id, invitee_id, text)
+                                VALUES (?, ?, ?)''',
+                             (inviter.id, invitee.id, text))
         return True
     except Exception as e:
         print(f"Error inviting user: {e}")
         return False
-    finally:
-        conn.close()
 
 def list_invitations_for_user(username: str):
     user = get_user(username)
@@ -90,62 +54,56 @@ def list_invitations_for_user(username: str):
             'inviter': row[3]
         })
     
-    conn.close()
     return invitations
 
 def accept_invitation(invitation_id: int) -> bool:
-    conn = get_db()
-    c = conn.cursor()
-    
-    try:
+    def job(conn):
         # Get invitation details
-        c.execute('SELECT inviter_id, invitee_id, text FROM collaboration_invitations WHERE id = ?', (invitation_id,))
-        inv = c.fetchone()
+        inv = conn.execute('SELECT inviter_id, invitee_id, text FROM collaboration_invitations WHERE id = ?',
+                           (invitation_id,)).fetchone()
         if not inv:
             return False
         
         # Update invitation status
-        c.execute('UPDATE collaboration_invitations SET status = ? WHERE id = ?', ('accepted', invitation_id))
+        conn.execute('UPDATE collaboration_invitations SET status = ? WHERE id = ?', ('accepted', invitation_id))
         
         # Create collaboration
-        c.execute('''INSERT INTO collaborations 
-                     (invitation_id, text, last_edited_by)
-                     VALUES (?, ?, ?)''',
-                  (invitation_id, inv[2], inv[1]))
-        
-        conn.commit()
+        conn.execute('''INSERT INTO collaborations 
+                        (invitation_id, text, last_edited_by)
+                        VALUES (?, ?, ?)''',
+                     (invitation_id, inv[2], inv[1]))
         return True
+
+    try:
+        return get_writer().write(job)
     except Exception as e:
         print(f"Error accepting invitation: {e}")
         return False
-    finally:
-        conn.close()
 
 def reject_invitation(invitation_id: int) -> bool:
-    conn = get_db()
-    c = conn.cursor()
-    
-    try:
+    def job(conn):
         # Get invitation details
-        c.execute('SELECT inviter_id, invitee_id FROM collaboration_invitations WHERE id = ? AND status = ?', 
-                 (invitation_id, 'pending'))
-        inv = c.fetchone()
+        inv = conn.execute('SELECT inviter_id, invitee_id FROM collaboration_invitations WHERE id = ? AND status = ?', 
+                           (invitation_id, 'pending')).fetchone()
         if not inv:
-            return False
+            return None
         
         # Update invitation status
-        c.execute('UPDATE collaboration_invitations SET status = ? WHERE id = ?', ('rejected', invitation_id))
+        conn.execute('UPDATE collaboration_invitations SET status = ? WHERE id = ?', ('rejected', invitation_id))
         
         # Apply penalty to inviter
-        update_tokens(inv[0], -3)  # 3 token penalty
-        
-        conn.commit()
+        apply_token_change(conn, inv[0], -3, 'rejected invitation')  # 3 token penalty
+        return inv[0]
+
+    try:
+        inviter_id = get_writer().write(job)
+        if inviter_id is None:
+            return False
+        invalidate_user(inviter_id)
         return True
     except Exception as e:
         print(f"Error rejecting invitation: {e}")
         return False
-    finally:
-        conn.close()
 
 def list_collaborations_for_user(username: str):
     user = get_user(username)
@@ -177,29 +135,19 @@ def list_collaborations_for_user(username: str):
             'collaborator': row[2]
         })
     
-    conn.close()
     return collaborations
 
 def update_collaboration(collaboration_id: int, user_id: int, new_text: str) -> bool:
-    conn = get_db()
-    c = conn.cursor()
-    
     try:
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        c.execute('''UPDATE collaborations 
-                     SET text = ?, last_edited_by = ?, last_edited_at = ?
-                     WHERE id = ?''',
-                  (new_text, user_id, current_time, collaboration_id))
-        conn.commit()
+        get_writer().execute('''UPDATE collaborations 
+                                SET text = ?, last_edited_by = ?, last_edited_at = ?
+                                WHERE id = ?''',
+                             (new_text, user_id, current_time, collaboration_id))
         return True
     except Exception as e:
         print(f"Error updating collaboration: {e}")
         return False
-    finally:
-        conn.close()
-
-# Initialize collaboration tables
-init_collaboration_tables()
 
 def share_text_file(text_id: int, user_ids: list):
     """Share a text file with multiple users"""
@@ -277,5 +225,4 @@ def get_user_collaborations(user_id):
             'inviter': row[4],
             'invitee': row[5]
         })
-    conn.close()
     return collaborations 
\ No newline at end of file
@@ -1,24 +1,11 @@
 # Complaints and admin actions
 
-import sqlite3
-from datetime import datetime
+import time
+from db import get_connection
 
 def get_db():
-    conn = sqlite3.connect('editor.db')
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS complaints (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            complainer_id INTEGER NOT NULL,
-            complained_id INTEGER NOT NULL,
-            reason TEXT NOT NULL,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            resolved_at TIMESTAMP,
-            action_taken TEXT,
-            penalty_tokens INTEGER DEFAULT 0
-        )
-    ''')
-    return conn
+    # Complaints live in the main database, next to the users they refer to
+    return get_connection()
 
 def submit_complaint(complainer_id: int, complained_id: int, reason: str):
     """Submit a complaint about a collaborator"""
@@ -31,10 +18,9 @@ def submit_complaint(complainer_id: int, complained_id: int, reason: str):
         conn.commit()
         return True
     except Exception as e:
+        conn.rollback()
         print(f"Error submitting complaint: {e}")
         return False
-    finally:
-        conn.close()
 
 def resolve_complaint(complaint_id: int, action: str, penalty_tokens: int = 0):
     """Super user resolves a complaint and applies penalty if needed"""
@@ -43,19 +29,18 @@ def resolve_complaint(complaint_id: int, action: str, penalty_tokens: int = 0):
         conn.execute(
             '''UPDATE complaints 
                SET status = 'resolved', 
-                   resolved_at = CURRENT_TIMESTAMP,
+                   resolved_at = ?,
                    action_taken = ?,
                    penalty_tokens = ?
                WHERE id = ?''',
-            (action, penalty_tokens, complaint_id)
+            (time.time(), action, penalty_tokens, complaint_id)
         )
         conn.commit()
         return True
     except Exception as e:
+        conn.rollback()
         print(f"Error resolving complaint: {e}")
         return False
-    finally:
-        conn.close()
 
 def get_complaints_for_user(user_id: int):
     """Get complaints involving a user (either as complainer or complained)"""
@@ -71,8 +56,6 @@ def get_complaints_for_user(user_id: int):
     except Exception as e:
         print(f"Error getting complaints: {e}")
         return []
-    finally:
-        conn.close()
 
 def get_pending_complaints():
     """Get all pending complaints for admin review"""
@@ -84,6 +67,4 @@ def get_pending_complaints():
         return cursor.fetchall()
     except Exception as e:
         print(f"Error getting pending complaints: {e}")
-        return []
-    finally:
-        conn.close() 
\ No newline at end of file
+        return []
\ No newline at end of file
@@ -0,0 +1,121 @@
+# Cache of sentence corrections shared by all sessions
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+CACHE_DB_PATH = 'correction_cache.db'
+# Disk hits whose last_used update waits for the next write, or is flushed once this many pile up
+MAX_PENDING_TOUCHES = 256
+
+def cache_key(normalized: str, model_id: str, settings: dict) -> str:
+    """Build a cache key from a normalized sentence, the model and its decoding settings"""
+    settings_part = ','.join(f'{name}={value}' for name, value in sorted(settings.items()))
+    raw = f'{model_id}\x00{settings_part}\x00{normalized}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class CorrectionCache:
+    """LRU cache of corrected sentences with an optional SQLite tier behind it"""
+
+    def __init__(self, max_entries=10000, db_path=None, max_db_entries=200000):
+        self.max_entries = max_entries
+        self.max_db_entries = max_db_entries
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._db_size = 0
+        self._touches = {}
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            # Commits on the request path should not wait for an fsync each
+            self._conn.execute('PRAGMA journal_mode = WAL')
+            self._conn.execute('PRAGMA synchronous = NORMAL')
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS correction_cache (
+                key TEXT PRIMARY KEY,
+                corrected TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_correction_cache_last_used ON correction_cache (last_used)')
+            self._conn.commit()
+            self._db_size = self._conn.execute('SELECT COUNT(*) FROM correction_cache').fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            corrected = self._entries.get(key)
+            if corrected is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return corrected
+
+            if self._conn is not None:
+                row = self._conn.execute('SELECT corrected FROM correction_cache WHERE key = ?', (key,)).fetchone()
+                if row:
+                    self._touches[key] = time.time()
+                    if len(self._touches) >= MAX_PENDING_TOUCHES:
+                        self._flush_touches()
+                        self._conn.commit()
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, corrected: str):
+        with self._lock:
+            self._remember(key, corrected)
+            if self._conn is None:
+                return
+            self._flush_touches()
+            cursor = self._conn.execute('INSERT OR REPLACE INTO correction_cache (key, corrected, last_used) VALUES (?, ?, ?)',
+                                        (key, corrected, time.time()))
+            # Replacements are counted too; the count is refreshed on eviction
+            self._db_size += cursor.rowcount
+            if self._db_size > self.max_db_entries:
+                # Evict the least recently used tenth in one statement
+                evict = max(self._db_size - self.max_db_entries, self.max_db_entries // 10)
+                self._conn.execute('''DELETE FROM correction_cache WHERE key IN (
+                    SELECT key FROM correction_cache ORDER BY last_used LIMIT ?)''', (evict,))
+                self._db_size = self._conn.execute('SELECT COUNT(*) FROM correction_cache').fetchone()[0]
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'memory_entries': len(self._entries),
+                'disk_entries': self._db_size
+            }
+
+    def _flush_touches(self):
+        # Caller holds the lock and commits
+        if self._touches:
+            self._conn.executemany('UPDATE correction_cache SET last_used = ? WHERE key = ?',
+                                   [(used, key) for key, used in self._touches.items()])
+            self._touches = {}
+
+    def _remember(self, key, corrected):
+        self._entries[key] = corrected
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_correction_cache(db_path=CACHE_DB_PATH) -> CorrectionCache:
+    """Return the process-wide correction cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CorrectionCache(db_path=db_path)
+    return _cache
@@ -0,0 +1,162 @@
+# Shared SQLite connection management
+
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from migrations import migrate
+
+DB_FILE = 'llm_editor.db'
+
+# Applied to every new connection. WAL lets readers run alongside the writer,
+# and synchronous=NORMAL only syncs at checkpoints, which is safe under WAL.
+PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000'
+]
+
+# Most write jobs committed together in one transaction
+MAX_GROUP_SIZE = 64
+# Seconds write() waits for its group to commit before raising TimeoutError
+WRITE_TIMEOUT = 30.0
+
+_local = threading.local()
+
+# Databases whose schema this process has already brought up to date
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+def get_connection(path=None) -> sqlite3.Connection:
+    """Return this thread's persistent connection to path (the main database by default)
+
+    Connections stay open for the life of the thread, so callers must commit or
+    roll back their own transactions and must not close the connection.
+    """
+    path = path or DB_FILE
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = connect(path)
+        connections[path] = conn
+    return conn
+
+def connect(path, **kwargs) -> sqlite3.Connection:
+    """Open a new connection with the configured pragmas
+
+    The first connection to each database in a process applies any pending
+    schema migrations; later ones skip straight past.
+    """
+    conn = sqlite3.connect(path, **kwargs)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    with _migrated_lock:
+        if path not in _migrated:
+            migrate(conn)
+            _migrated.add(path)
+    return conn
+
+def close_connections():
+    """Close every connection opened by the current thread"""
+    for conn in getattr(_local, 'connections', {}).values():
+        conn.close()
+    _local.connections = {}
+
+class GroupCommitWriter:
+    """Runs write jobs from every session on one connection, committing them in groups
+
+    A job is a callable that takes the connection and must not commit. Jobs that
+    queue up while a transaction is in progress run together in the next one,
+    each inside its own savepoint so a failing job does not undo the others.
+    write() blocks until the group has committed, so the caller's next read
+    sees its change. If the writer cannot open its connection, every job fails
+    with that error instead of waiting forever.
+    """
+
+    def __init__(self, path=None, max_group_size=MAX_GROUP_SIZE):
+        self.path = path or DB_FILE
+        self.max_group_size = max_group_size
+        # Set when the connection could not be opened; the writer is then dead
+        self.error = None
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, job) -> Future:
+        """Queue a job and return a future for its result"""
+        future = Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            self._jobs.put((job, future))
+        return future
+
+    def write(self, job, timeout=WRITE_TIMEOUT):
+        """Run a job and wait up to timeout seconds for its transaction to commit"""
+        return self.submit(job).result(timeout)
+
+    def execute(self, sql, params=()) -> int:
+        """Run one statement and return the number of rows it changed"""
+        return self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    def _run(self):
+        # Autocommit mode, so transactions and savepoints are managed explicitly
+        try:
+            conn = connect(self.path, isolation_level=None)
+        except Exception as e:
+            print(f"Error opening {self.path} for writing: {e}")
+            self.error = e
+            # Fail the jobs queued before the error was set, and any that race it
+            while True:
+                self._jobs.get()[1].set_exception(e)
+        while True:
+            jobs = [self._jobs.get()]
+            while len(jobs) < self.max_group_size:
+                try:
+                    jobs.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit_group(conn, jobs)
+
+    def _commit_group(self, conn, jobs):
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for job, future in jobs:
+                conn.execute('SAVEPOINT job')
+                try:
+                    outcomes.append((future, job(conn), None))
+                    conn.execute('RELEASE job')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO job')
+                    conn.execute('RELEASE job')
+                    outcomes.append((future, None, e))
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for _, future in jobs:
+                future.set_exception(e)
+            return
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer(path=None) -> GroupCommitWriter:
+    """Return the process-wide writer for path (the main database by default)"""
+    path = path or DB_FILE
+    with _writers_lock:
+        # A writer that could not open its connection is replaced on the next call
+        if path not in _writers or _writers[path].error is not None:
+            _writers[path] = GroupCommitWriter(path)
+        return _writers[path]
+
@@ -0,0 +1,157 @@
+# Write-behind log of corrections, stored compressed in correction_history
+
+import atexit
+import queue
+import threading
+import time
+import zlib
+from typing import Optional
+from db import get_connection, get_writer
+
+# Corrections held in memory waiting to be written, and their compressed
+# size; more are dropped and counted
+MAX_QUEUE = 10000
+MAX_QUEUE_BYTES = 64 * 1024 * 1024
+# Most corrections written in one transaction
+BATCH_SIZE = 256
+# Seconds a correction may wait for its batch to fill before it is written anyway
+FLUSH_INTERVAL = 1.0
+COMPRESSION_LEVEL = 6
+
+def compress_text(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+def decompress_text(data, compression) -> str:
+    if compression == 'zlib':
+        return zlib.decompress(data).decode('utf-8')
+    return data
+
+class HistoryLogger:
+    """Queues corrections and writes them to correction_history in batches from a background thread
+
+    log() never blocks: when the queue holds max_queue corrections or
+    max_queue_bytes of compressed text, the correction is dropped and counted
+    in stats() instead. Texts are compressed in log(), so the byte budget
+    bounds what the queue actually holds however long the texts are.
+    """
+
+    def __init__(self, path=None, max_queue=MAX_QUEUE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_queue_bytes=MAX_QUEUE_BYTES):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_bytes = max_queue_bytes
+        self.written = 0
+        self.dropped = 0
+        self._queued_bytes = 0
+        self._lock = threading.Lock()
+        self._entries = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name='history-logger', daemon=True)
+        self._thread.start()
+
+    def log(self, user_id, original_text: str, corrected_text: str, mode: str, tokens_used: int) -> bool:
+        """Queue one correction; returns False when it had to be dropped"""
+        original, corrected = compress_text(original_text), compress_text(corrected_text)
+        size = len(original) + len(corrected)
+        with self._lock:
+            if self._queued_bytes + size > self.max_queue_bytes:
+                self.dropped += 1
+                return False
+            self._queued_bytes += size
+        try:
+            self._entries.put_nowait((user_id, original, corrected, mode, tokens_used, time.time(), size))
+            return True
+        except queue.Full:
+            with self._lock:
+                self._queued_bytes -= size
+                self.dropped += 1
+            return False
+
+    def flush(self):
+        """Block until every queued correction has been written"""
+        self._entries.join()
+
+    def stats(self) -> dict:
+        return {'queued': self._entries.qsize(), 'queued_bytes': self._queued_bytes, 'written': self.written,
+                'dropped': self.dropped}
+
+    def _run(self):
+        while True:
+            batch = [self._entries.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._entries.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self.written += len(batch)
+            except Exception as e:
+                print(f"Error writing correction history: {e}")
+            finally:
+                with self._lock:
+                    self._queued_bytes -= sum(entry[-1] for entry in batch)
+                for _ in batch:
+                    self._entries.task_done()
+
+    def _write(self, batch):
+        rows = [(user_id, original, corrected, mode, tokens_used,
+                 time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(logged_at)), 'zlib')
+                for user_id, original, corrected, mode, tokens_used, logged_at, _ in batch]
+        get_writer(self.path).write(lambda conn: conn.executemany('''INSERT INTO correction_history
+            (user_id, original_text, corrected_text, correction_type, tokens_used, timestamp, compression)
+            VALUES (?, ?, ?, ?, ?, ?, ?)''', rows))
+
+_logger = None
+_logger_lock = threading.Lock()
+
+def get_history_logger() -> HistoryLogger:
+    """Return the process-wide history logger, flushed when the process exits"""
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            _logger = HistoryLogger()
+            atexit.register(_logger.flush)
+    return _logger
+
+class HistoryEntry:
+    """One correction_history row; the texts are decompressed on first access"""
+    __slots__ = ('id', 'user_id', 'mode', 'tokens_used', 'timestamp', '_original', '_corrected', '_compression')
+
+    def __init__(self, row):
+        (self.id, self.user_id, self.mode, self.tokens_used, self.timestamp,
+         self._original, self._corrected, self._compression) = row
+
+    @property
+    def original_text(self) -> str:
+        self._decompress()
+        return self._original
+
+    @property
+    def corrected_text(self) -> str:
+        self._decompress()
+        return self._corrected
+
+    def _decompress(self):
+        if self._compression:
+            self._original = decompress_text(self._original, self._compression)
+            self._corrected = decompress_text(self._corrected, self._compression)
+            self._compression = None
+
+def get_correction_history(user_id, before_id: Optional[int] = None, limit: int = 50) -> list:
+    """Return up to limit of a user's corrections, newest first, older than before_id if given"""
+    params = [user_id]
+    keyset = ''
+    if before_id is not None:
+        keyset = 'AND id < ?'
+        params.append(before_id)
+    rows = get_connection().execute(f'''SELECT id, user_id, correction_type, tokens_used, timestamp,
+                                               original_text, corrected_text, compression
+                                        FROM correction_history
+                                        WHERE user_id = ? {keyset}
+                                        ORDER BY id DESC LIMIT ?''', params + [limit]).fetchall()
+    return [HistoryEntry(row) for row in rows]
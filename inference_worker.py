@@ -0,0 +1,139 @@
+# Shared inference worker for all Streamlit sessions
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from llm_utils import load_llm
+
+# How long the worker waits for requests from other sessions before running a batch
+MAX_WAIT_SECONDS = 0.02
+# Upper bound on prompts combined into one model call
+MAX_BATCH_SIZE = 16
+# Model backend ('fp32' or 'int8') and torch thread count used by the worker
+BACKEND = 'fp32'
+NUM_THREADS = None
+
+class InferenceWorker:
+    """Owns a single model and runs requests from every session in micro-batches.
+
+    The worker is callable like the pipeline returned by load_llm, so it can be
+    passed to correct_text in its place.
+    """
+
+    def __init__(self, llm, max_wait=MAX_WAIT_SECONDS, max_batch_size=MAX_BATCH_SIZE):
+        self.llm = llm
+        self.tokenizer = getattr(llm, 'tokenizer', None)
+        self.model_id = getattr(llm, 'model_id', None)
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='inference-worker', daemon=True)
+        self._thread.start()
+
+    def submit(self, prompts: list, **generate_kwargs) -> Future:
+        """Queue prompts for generation and return a future for their results"""
+        future = Future()
+        self._requests.put((list(prompts), generate_kwargs, future))
+        return future
+
+    def __call__(self, prompts, **generate_kwargs):
+        if isinstance(prompts, str):
+            prompts = [prompts]
+        # The worker sizes its own batches across sessions
+        generate_kwargs.pop('batch_size', None)
+        return self.submit(prompts, **generate_kwargs).result()
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            size = len(batch[0][0])
+            # Collect whatever else arrives within the wait window
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self._process(batch)
+
+    def _process(self, batch):
+        # Requests can only share a model call when their decoding settings match
+        groups = {}
+        for prompts, generate_kwargs, future in batch:
+            key = tuple(sorted(generate_kwargs.items()))
+            groups.setdefault(key, []).append((prompts, future))
+
+        for key, requests in groups.items():
+            prompts = [prompt for request_prompts, _ in requests for prompt in request_prompts]
+            try:
+                results = self.llm(prompts, batch_size=len(prompts), **dict(key))
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_prompts, future in requests:
+                future.set_result(results[offset:offset + len(request_prompts)])
+                offset += len(request_prompts)
+
+# Text generated once after loading so the first real request is not slow
+WARMUP_TEXT = "grammar: This is a warm up sentence."
+
+_worker = None
+_worker_lock = threading.Lock()
+_ready = threading.Event()
+# 'cold', 'warming', 'ready' or 'failed'
+_state = 'cold'
+# Seconds a failed load stays failed before the next get_worker() tries again
+RETRY_SECONDS = 300
+_failed_at = 0.0
+
+def model_state() -> str:
+    """Return the readiness of the shared model"""
+    return _state
+
+def _warm_up(max_wait, max_batch_size, backend, num_threads):
+    global _worker, _state, _failed_at
+    llm = load_llm(backend, num_threads)
+    if llm is None:
+        _failed_at = time.monotonic()
+        _state = 'failed'
+        _ready.set()
+        return
+    worker = InferenceWorker(llm, max_wait, max_batch_size)
+    try:
+        worker([WARMUP_TEXT], max_length=32, num_beams=1)
+    except Exception as e:
+        print(f"Error warming up model: {e}")
+    _worker = worker
+    _state = 'ready'
+    _ready.set()
+
+def start_warmup(max_wait=MAX_WAIT_SECONDS, max_batch_size=MAX_BATCH_SIZE, backend=BACKEND, num_threads=NUM_THREADS):
+    """Load and warm up the shared model on a background thread, once per process
+
+    A failed load stays failed for RETRY_SECONDS, so callers can report it,
+    before it is tried again.
+    """
+    global _state
+    with _worker_lock:
+        if _state == 'cold' or (_state == 'failed' and time.monotonic() - _failed_at >= RETRY_SECONDS):
+            _state = 'warming'
+            _ready.clear()
+            threading.Thread(target=_warm_up, args=(max_wait, max_batch_size, backend, num_threads),
+                             name='model-warmup', daemon=True).start()
+
+def get_worker(max_wait=MAX_WAIT_SECONDS, max_batch_size=MAX_BATCH_SIZE, backend=BACKEND, num_threads=NUM_THREADS,
+               block=True):
+    """Return the process-wide worker, or None while it is warming up (block=False) or failed"""
+    start_warmup(max_wait, max_batch_size, backend, num_threads)
+    if block:
+        _ready.wait()
+    return _worker
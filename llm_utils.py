@@ -1,23 +1,64 @@
-from transformers import pipeline, AutoModelForSeq2SeqLM, AutoTokenizer
-from blacklist import get_blacklist, is_blacklisted
+from blacklist import get_matcher
+from correction_cache import cache_key
+import difflib
 import re
+import time
 
-def load_llm():
-    """Load a grammar correction model"""
+# T5 model specifically fine-tuned for grammar correction
+MODEL_NAME = 'vennify/t5-base-grammar-correction'
+BACKENDS = ('fp32', 'int8')
+
+# Named decoding settings, from cheapest to best quality
+DECODING_PROFILES = {
+    'greedy': {'max_length': 128, 'num_beams': 1},
+    'beam-2': {'max_length': 128, 'num_beams': 2, 'early_stopping': True},
+    'beam-5': {'max_length': 128, 'num_beams': 5, 'early_stopping': True}
+}
+DEFAULT_PROFILE = 'beam-5'
+# Cheaper profile to switch to when a request is about to exceed its latency budget
+FALLBACK_PROFILES = {'beam-5': 'beam-2', 'beam-2': 'greedy'}
+
+# Decoding profile and latency budget (seconds, None for unlimited) for each role
+ROLE_PROFILES = {
+    'free': ('greedy', 5.0),
+    'user': ('beam-5', 30.0),  # accounts created through Sign Up
+    'paid': ('beam-5', 30.0),
+    'super': ('beam-5', None)
+}
+
+def load_llm(backend: str = 'fp32', num_threads: int = None):
+    """Load a grammar correction model
+
+    backend is 'fp32' or 'int8' (dynamic quantization of the linear layers for
+    CPU inference). num_threads limits the torch intra-op thread pool.
+    """
     try:
-        # Use T5 model specifically fine-tuned for grammar correction
-        model = AutoModelForSeq2SeqLM.from_pretrained('vennify/t5-base-grammar-correction')
-        tokenizer = AutoTokenizer.from_pretrained('vennify/t5-base-grammar-correction')
-        return pipeline('text2text-generation', 
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+        # Imported here so pages that never correct text do not pay for torch
+        import torch
+        from transformers import pipeline, AutoModelForSeq2SeqLM, AutoTokenizer
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        if backend == 'int8':
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        llm = pipeline('text2text-generation', 
                        model=model, 
                        tokenizer=tokenizer,
-                       max_length=128,
-                       num_beams=5,
-                       early_stopping=True)
+                       **DECODING_PROFILES[DEFAULT_PROFILE])
+        # Corrections from different backends are cached separately
+        llm.model_id = MODEL_NAME if backend == 'fp32' else f"{MODEL_NAME}:{backend}"
+        return llm
     except Exception as e:
         print(f"Error loading model: {e}")
         return None
 
+def profile_for_role(role: str) -> tuple:
+    """Return the (profile, latency budget) used for a user role"""
+    return ROLE_PROFILES.get(role, ROLE_PROFILES['free'])
+
 def preprocess_text(text: str) -> str:
     """Preprocess text for grammar correction"""
     # Remove extra spaces
@@ -27,7 +68,262 @@ def preprocess_text(text: str) -> str:
         text += '.'
     return text
 
-def correct_text(llm, text: str) -> str:
+# Number of segments sent through the model in one padded batch
+DEFAULT_BATCH_SIZE = 8
+# Token budget for one segment; leaves room in max_length for the corrected output
+MAX_SEGMENT_TOKENS = 96
+
+# Words whose trailing period does not end a sentence
+ABBREVIATIONS = {
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'vs', 'etc', 'e.g', 'i.e',
+    'inc', 'ltd', 'co', 'no', 'fig', 'approx', 'dept', 'est', 'u.s', 'a.m', 'p.m'
+}
+# Terminal punctuation followed by whitespace, so decimals and URLs are left intact
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*(?=\s|$)')
+CLAUSE_END = re.compile(r'(?<=[,;:])\s+')
+
+def split_sentences(text: str) -> list:
+    """Split preprocessed text into sentences, keeping their terminal punctuation"""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        words = text[start:match.start()].split()
+        if match.group() == '.' and words:
+            last_word = words[-1].lower()
+            # Skip abbreviations and initials such as "J."
+            if last_word in ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha()):
+                continue
+        sentence = text[start:match.end()].strip()
+        if sentence.strip('.!?"\')] '):
+            sentences.append(sentence)
+        start = match.end()
+    rest = text[start:].strip()
+    if rest:
+        sentences.append(rest)
+    return sentences
+
+def count_tokens(tokenizer, texts: list) -> list:
+    """Count model tokens for each text, without special tokens"""
+    if not texts:
+        return []
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)['input_ids']]
+
+def split_long_sentence(tokenizer, sentence: str, max_tokens: int) -> list:
+    """Split a sentence that exceeds the token budget, preferring clause boundaries"""
+    pieces = []
+    current = []
+    current_tokens = 0
+    clauses = CLAUSE_END.split(sentence)
+    for clause, tokens in zip(clauses, count_tokens(tokenizer, clauses)):
+        # Fall back to word boundaries for a clause that is too long by itself
+        parts = [(clause, tokens)]
+        if tokens > max_tokens:
+            words = clause.split()
+            parts = list(zip(words, count_tokens(tokenizer, words)))
+        for part, part_tokens in parts:
+            if current and current_tokens + part_tokens > max_tokens:
+                pieces.append(' '.join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        pieces.append(' '.join(current))
+    return pieces
+
+def pack_segments(tokenizer, sentences: list, max_tokens: int = MAX_SEGMENT_TOKENS) -> list:
+    """Pack adjacent sentences into segments that fit the token budget
+
+    Returns (segment, positions) pairs, where positions are the indices of the
+    sentences in the segment. A sentence over the budget is split into several
+    segments that each cover only that sentence.
+    """
+    segments = []
+    current = []
+    positions = []
+    current_tokens = 0
+    for position, (sentence, tokens) in enumerate(zip(sentences, count_tokens(tokenizer, sentences))):
+        if current and (tokens > max_tokens or current_tokens + tokens > max_tokens):
+            segments.append((' '.join(current), positions))
+            current, positions, current_tokens = [], [], 0
+        if tokens > max_tokens:
+            segments.extend((piece, [position]) for piece in split_long_sentence(tokenizer, sentence, max_tokens))
+            continue
+        current.append(sentence)
+        positions.append(position)
+        current_tokens += tokens
+    if current:
+        segments.append((' '.join(current), positions))
+    return segments
+
+def strip_prefix(corrected: str) -> str:
+    """Remove the "grammar: " prefix if present"""
+    if corrected.startswith("grammar: "):
+        corrected = corrected[9:]
+    return corrected
+
+def join_sentences(sentences: list) -> str:
+    """Join corrected sentences, skipping the empty ones merged into a neighbour"""
+    return ' '.join(sentence for sentence in sentences if sentence)
+
+def iter_corrected_sentences(llm, sentences: list, batch_size: int = DEFAULT_BATCH_SIZE, cache=None,
+                             profile: str = DEFAULT_PROFILE, latency_budget: float = None):
+    """Yield (index, corrected sentence) pairs as soon as each sentence is ready
+
+    Cache lookups and deduplication are per sentence; only the distinct misses
+    are packed into token-bounded segments for the model. When the correction
+    of a segment cannot be split back into its sentences, the first sentence
+    gets the whole correction and the others an empty string.
+
+    When latency_budget is set and the remaining batches would overrun it at the
+    current pace, the rest of the request switches to a cheaper profile.
+    """
+    model_id = getattr(llm, 'model_id', None) or MODEL_NAME
+
+    # Serve cached sentences and run each distinct remaining sentence only once
+    pending = {}
+    for i, sentence in enumerate(sentences):
+        normalized = preprocess_text(sentence)
+        cached = cache.get(cache_key(normalized, model_id, DECODING_PROFILES[profile])) if cache else None
+        if cached is not None:
+            yield i, cached
+        else:
+            pending.setdefault(normalized, []).append(i)
+
+    keys = list(pending)
+    texts = [sentences[pending[key][0]] for key in keys]
+    tokenizer = getattr(llm, 'tokenizer', None)
+    if tokenizer is None:
+        segments = [(text, [position]) for position, text in enumerate(texts)]
+    else:
+        segments = pack_segments(tokenizer, texts)
+    # Corrected parts of each pending sentence by segment, and its segments still running
+    parts = [{} for _ in keys]
+    waiting = [0] * len(keys)
+    cacheable = [True] * len(keys)
+    for _, positions in segments:
+        for position in positions:
+            waiting[position] += 1
+
+    # Sort by length so every batch pads to roughly the same size
+    order = sorted(range(len(segments)), key=lambda s: len(segments[s][0]))
+    started = time.monotonic()
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        settings = DECODING_PROFILES[profile]
+        prompts = [f"grammar: {segments[s][0]}" for s in bucket]
+        results = llm(prompts, batch_size=len(prompts), **settings)
+        for s, result in zip(bucket, results):
+            # The pipeline wraps each output in a list when asked for several sequences
+            if isinstance(result, list):
+                result = result[0]
+            corrected = strip_prefix(result['generated_text'])
+            positions = segments[s][1]
+            split = split_sentences(corrected) if len(positions) > 1 else [corrected]
+            if len(split) != len(positions):
+                split = [corrected] + [''] * (len(positions) - 1)
+                for position in positions:
+                    cacheable[position] = False
+            for position, sentence in zip(positions, split):
+                parts[position][s] = sentence
+                waiting[position] -= 1
+                if waiting[position]:
+                    continue
+                sentence = ' '.join(parts[position][p] for p in sorted(parts[position]))
+                if cache and cacheable[position]:
+                    cache.put(cache_key(keys[position], model_id, settings), sentence)
+                for i in pending[keys[position]]:
+                    yield i, sentence
+
+        done = start + len(bucket)
+        if latency_budget is not None and profile in FALLBACK_PROFILES and done < len(order):
+            elapsed = time.monotonic() - started
+            if elapsed + elapsed / done * (len(order) - done) > latency_budget:
+                profile = FALLBACK_PROFILES[profile]
+
+def correct_sentences(llm, sentences: list, batch_size: int = DEFAULT_BATCH_SIZE, cache=None,
+                      profile: str = DEFAULT_PROFILE, latency_budget: float = None) -> list:
+    """Correct a list of sentences in length-bucketed batches, keeping their order"""
+    corrected = [None] * len(sentences)
+    for i, sentence in iter_corrected_sentences(llm, sentences, batch_size, cache, profile, latency_budget):
+        corrected[i] = sentence
+    return corrected
+
+def iter_correct_segments(llm, sentences: list, reused: dict = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                          cache=None, profile: str = DEFAULT_PROFILE, latency_budget: float = None,
+                          unchanged: set = None):
+    """Yield (index, corrected sentence) pairs as each sentence is corrected
+
+    Sentences listed in reused are yielded first with their known correction. If
+    correction fails part way, the remaining sentences are yielded unchanged and
+    their indices added to unchanged when it is given.
+    """
+    reused = reused or {}
+    done = set()
+    for i, corrected in reused.items():
+        done.add(i)
+        yield i, corrected
+
+    pending = [i for i in range(len(sentences)) if i not in reused]
+    try:
+        if llm:
+            for j, sentence in iter_corrected_sentences(llm, [sentences[i] for i in pending], batch_size, cache,
+                                                        profile, latency_budget):
+                done.add(pending[j])
+                yield pending[j], sentence
+    except Exception as e:
+        print(f"Error correcting text: {e}")
+    for i, sentence in enumerate(sentences):
+        if i not in done:
+            if unchanged is not None:
+                unchanged.add(i)
+            yield i, sentence
+
+def iter_correct_text(llm, text: str, batch_size: int = DEFAULT_BATCH_SIZE, cache=None,
+                      profile: str = DEFAULT_PROFILE, latency_budget: float = None):
+    """Yield (index, corrected sentence) pairs for text as each sentence is corrected
+
+    Indices refer to split_sentences(preprocess_text(text)).
+    """
+    yield from iter_correct_segments(llm, split_sentences(preprocess_text(text)), None, batch_size, cache,
+                                     profile, latency_budget)
+
+def plan_incremental_correction(old_text: str, old_corrected: str, new_text: str) -> tuple:
+    """Split new_text into sentences and find corrections reusable from a previous run
+
+    Returns (sentences, reused), where reused maps the index of each unchanged
+    sentence to its previous correction. When old_corrected cannot be lined up
+    with old_text sentence by sentence, nothing is reused.
+    """
+    old_sentences = split_sentences(preprocess_text(old_text))
+    old_corrections = split_sentences(preprocess_text(old_corrected))
+    new_sentences = split_sentences(preprocess_text(new_text))
+    if len(old_sentences) != len(old_corrections):
+        return new_sentences, {}
+
+    reused = {}
+    matcher = difflib.SequenceMatcher(None, old_sentences, new_sentences, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                reused[j] = old_corrections[i]
+    return new_sentences, reused
+
+def correct_text_incremental(llm, old_text: str, old_corrected: str, new_text: str,
+                             batch_size: int = DEFAULT_BATCH_SIZE, cache=None,
+                             profile: str = DEFAULT_PROFILE, latency_budget: float = None) -> str:
+    """Correct new_text, running only sentences that changed since old_text through the model
+
+    old_corrected is the output of correct_text for old_text.
+    """
+    sentences, reused = plan_incremental_correction(old_text, old_corrected, new_text)
+    corrected = list(sentences)
+    for i, sentence in iter_correct_segments(llm, sentences, reused, batch_size, cache,
+                                             profile, latency_budget):
+        corrected[i] = sentence
+    return join_sentences(corrected)
+
+def correct_text(llm, text: str, batch_size: int = DEFAULT_BATCH_SIZE, cache=None,
+                 profile: str = DEFAULT_PROFILE, latency_budget: float = None) -> str:
     """Correct grammar in text using the LLM"""
     if not llm:
         return text
@@ -36,44 +332,38 @@ def correct_text(llm, text: str) -> str:
         # Preprocess the input text
         text = preprocess_text(text)
         
-        # Split text into sentences
-        sentences = text.split('.')
-        corrected_sentences = []
-        
-        for sentence in sentences:
-            if not sentence.strip():
-                continue
-                
-            # Add period back for processing
-            sentence = sentence.strip() + '.'
-            
-            # Generate correction with optimized parameters
-            result = llm(f"grammar: {sentence}", max_length=128, num_beams=5, early_stopping=True)
-            corrected = result[0]['generated_text']
-            
-            # Remove the "grammar: " prefix if present
-            if corrected.startswith("grammar: "):
-                corrected = corrected[9:]
-                
-            corrected_sentences.append(corrected)
+        # Correct sentences in batches; uncached ones are packed into token-bounded segments
+        sentences = split_sentences(text)
+        corrected_sentences = correct_sentences(llm, sentences, batch_size, cache,
+                                                profile, latency_budget)
         
         # Join sentences back together
-        return ' '.join(corrected_sentences)
+        return join_sentences(corrected_sentences)
     except Exception as e:
         print(f"Error correcting text: {e}")
         return text
 
 def mask_blacklisted_words(text):
-    words = text.split()
-    masked_words = []
-    
-    for word in words:
-        if is_blacklisted(word):
-            masked_words.append('*' * len(word))
-        else:
-            masked_words.append(word)
-    
-    return ' '.join(masked_words)
+    return get_matcher().mask(text)
+
+class TextAnalysis:
+    """Word count, charges and masked text for a submission, from one pass over its words"""
+
+    def __init__(self, text: str, matcher=None):
+        matcher = matcher or get_matcher()
+        words = text.split()
+        flags = matcher.match(words)
+        self.word_count = len(words)
+        # Submissions cost one token per word
+        self.tokens_required = self.word_count
+        self.blacklisted_words = [word for word, flagged in zip(words, flags) if flagged]
+        # Each blacklisted word costs one token per character
+        self.blacklist_charge = sum(len(word) for word in self.blacklisted_words)
+        self.masked = ' '.join('*' * len(word) if flagged else word for word, flagged in zip(words, flags))
+
+def analyze_text(text: str) -> TextAnalysis:
+    """Analyze a submission once for both the free and paid paths"""
+    return TextAnalysis(text)
 
 def highlight_corrections(original: str, corrected: str) -> str:
     """Highlight differences between original and corrected text"""
@@ -94,4 +384,44 @@ def highlight_corrections(original: str, corrected: str) -> str:
             if i < len(original_words):
                 i += 1
     
-    return " ".join(result) 
\ No newline at end of file
+    return " ".join(result)
+
+# Sentences with typical mistakes, used to compare backends against fp32
+PARITY_CORPUS = [
+    "She go to school every day.",
+    "I has a apple in my bag.",
+    "They was playing football when it start to rain.",
+    "He don't like vegetables.",
+    "We is going to the park tomorrow.",
+    "The childrens are playing outside.",
+    "My brother have two cat.",
+    "Yesterday I eat pizza for dinner.",
+    "There is many reasons to learn English.",
+    "This sentence is already correct."
+]
+
+def check_backend_parity(backend: str = 'int8', corpus: list = PARITY_CORPUS, profile: str = DEFAULT_PROFILE,
+                         reference=None, candidate=None) -> dict:
+    """Compare corrections from a backend against the fp32 model on a fixed corpus"""
+    reference = reference or load_llm('fp32')
+    candidate = candidate or load_llm(backend)
+    expected = correct_sentences(reference, corpus, profile=profile)
+    actual = correct_sentences(candidate, corpus, profile=profile)
+    mismatches = [
+        {'input': sentence, 'fp32': fp32, backend: other}
+        for sentence, fp32, other in zip(corpus, expected, actual)
+        if fp32 != other
+    ]
+    return {
+        'backend': backend,
+        'total': len(corpus),
+        'matches': len(corpus) - len(mismatches),
+        'match_rate': (len(corpus) - len(mismatches)) / len(corpus),
+        'mismatches': mismatches
+    }
+
+if __name__ == '__main__':
+    report = check_backend_parity()
+    print(f"{report['backend']}: {report['matches']}/{report['total']} corrections match fp32")
+    for mismatch in report['mismatches']:
+        print(mismatch)
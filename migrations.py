@@ -0,0 +1,287 @@
+# Versioned schema migrations
+
+import sqlite3
+import time
+
+def create_base_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT DEFAULT 'user',
+        tokens INTEGER DEFAULT 0,
+        last_login REAL,
+        total_corrections INTEGER DEFAULT 0,
+        total_tokens_used INTEGER DEFAULT 0
+    )''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS blacklist (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        word TEXT UNIQUE NOT NULL,
+        added_by INTEGER,
+        added_at REAL DEFAULT (strftime('%s', 'now')),
+        status TEXT DEFAULT 'active',
+        FOREIGN KEY (added_by) REFERENCES users (id)
+    )''')
+
+    # Version stamp bumped by every change to the blacklist, so each process
+    # can tell with one query whether its compiled matcher is stale
+    conn.execute('''CREATE TABLE IF NOT EXISTS blacklist_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )''')
+    conn.execute('INSERT OR IGNORE INTO blacklist_version (id, version) VALUES (1, 0)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS blacklist_version_{event.lower()}
+                         AFTER {event} ON blacklist
+                         BEGIN
+                             UPDATE blacklist_version SET version = version + 1 WHERE id = 1;
+                         END''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS complaints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        complainer_id INTEGER NOT NULL,
+        complained_id INTEGER NOT NULL,
+        reason TEXT NOT NULL,
+        response TEXT,
+        status TEXT DEFAULT 'pending',
+        created_at REAL DEFAULT (strftime('%s', 'now')),
+        responded_at REAL,
+        resolved_at REAL,
+        action_taken TEXT,
+        penalty_tokens INTEGER DEFAULT 0,
+        penalty_user_id INTEGER,
+        FOREIGN KEY (complainer_id) REFERENCES users (id),
+        FOREIGN KEY (complained_id) REFERENCES users (id),
+        FOREIGN KEY (penalty_user_id) REFERENCES users (id)
+    )''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS collaboration_invitations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        inviter_id INTEGER NOT NULL,
+        invitee_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        status TEXT DEFAULT 'pending',
+        created_at REAL DEFAULT (strftime('%s', 'now')),
+        FOREIGN KEY (inviter_id) REFERENCES users (id),
+        FOREIGN KEY (invitee_id) REFERENCES users (id)
+    )''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS collaborations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        invitation_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        last_edited_by INTEGER NOT NULL,
+        last_edited_at REAL DEFAULT (strftime('%s', 'now')),
+        FOREIGN KEY (invitation_id) REFERENCES collaboration_invitations (id),
+        FOREIGN KEY (last_edited_by) REFERENCES users (id)
+    )''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS correction_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        original_text TEXT,
+        corrected_text TEXT,
+        correction_type TEXT,
+        tokens_used INTEGER,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS rejected_corrections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        original_text TEXT,
+        rejected_correction TEXT,
+        reason TEXT,
+        status TEXT DEFAULT 'pending',
+        reviewed_by INTEGER,
+        review_timestamp TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (reviewed_by) REFERENCES users (id)
+    )''')
+
+def add_complaint_and_invitation_indexes(conn):
+    # Databases created before the complaints table was rebuilt lack these columns
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(complaints)')}
+    for name, definition in [('response', 'TEXT'), ('responded_at', 'REAL'),
+                             ('penalty_tokens', 'INTEGER DEFAULT 0'), ('penalty_user_id', 'INTEGER')]:
+        if name not in columns:
+            conn.execute(f'ALTER TABLE complaints ADD COLUMN {name} {definition}')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_complaints_status_created ON complaints (status, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_complaints_complained_status ON complaints (complained_id, status)')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_invitations_invitee_status
+                    ON collaboration_invitations (invitee_id, status)''')
+
+def add_collaboration_and_review_indexes(conn):
+    # Lets the (inviter_id OR invitee_id) collaboration lookups start from the
+    # invitations instead of scanning every collaboration
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_invitations_inviter ON collaboration_invitations (inviter_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_collaborations_invitation ON collaborations (invitation_id)')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_rejected_corrections_status_reviewed
+                    ON rejected_corrections (status, review_timestamp)''')
+
+def create_token_ledger(conn):
+    # One row per balance change, with the balance it left behind
+    conn.execute('''CREATE TABLE IF NOT EXISTS token_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        amount INTEGER NOT NULL,
+        reason TEXT NOT NULL,
+        balance INTEGER NOT NULL,
+        created_at REAL DEFAULT (strftime('%s', 'now')),
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_token_ledger_user ON token_ledger (user_id, id)')
+
+def add_listing_indexes_and_counts(conn):
+    # Keyset pages of users filtered by role, in username order
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_role_username ON users (role, username)')
+
+    # Row counts per role and per complaint status, kept current by triggers so
+    # paginated listings can show totals without counting millions of rows
+    for table, column, counts in [('users', 'role', 'user_role_counts'),
+                                  ('complaints', 'status', 'complaint_status_counts')]:
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {counts} (
+            {column} TEXT PRIMARY KEY,
+            count INTEGER NOT NULL
+        )''')
+        # Recount from scratch, so rows left by an earlier database do not add up
+        conn.execute(f'DELETE FROM {counts}')
+        conn.execute(f'''INSERT INTO {counts} ({column}, count)
+                         SELECT {column}, COUNT(*) FROM {table} WHERE {column} IS NOT NULL GROUP BY {column}''')
+        increment = f'''INSERT INTO {counts} ({column}, count) VALUES (NEW.{column}, 1)
+                        ON CONFLICT ({column}) DO UPDATE SET count = count + 1;'''
+        decrement = f'UPDATE {counts} SET count = count - 1 WHERE {column} = OLD.{column};'
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {counts}_insert AFTER INSERT ON {table}
+                         WHEN NEW.{column} IS NOT NULL
+                         BEGIN {increment} END''')
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {counts}_delete AFTER DELETE ON {table}
+                         WHEN OLD.{column} IS NOT NULL
+                         BEGIN {decrement} END''')
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {counts}_update_old AFTER UPDATE OF {column} ON {table}
+                         WHEN OLD.{column} IS NOT NULL AND NEW.{column} IS NOT OLD.{column}
+                         BEGIN {decrement} END''')
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {counts}_update_new AFTER UPDATE OF {column} ON {table}
+                         WHEN NEW.{column} IS NOT NULL AND NEW.{column} IS NOT OLD.{column}
+                         BEGIN {increment} END''')
+
+def create_usage_rollups(conn):
+    # Running totals per user and per day and role, updated in the same
+    # transaction as the charge or correction they count
+    conn.execute('''CREATE TABLE IF NOT EXISTS user_usage (
+        user_id INTEGER PRIMARY KEY,
+        corrections INTEGER NOT NULL DEFAULT 0,
+        tokens_charged INTEGER NOT NULL DEFAULT 0,
+        penalties INTEGER NOT NULL DEFAULT 0,
+        bonuses INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS daily_usage (
+        day TEXT NOT NULL,
+        role TEXT NOT NULL,
+        corrections INTEGER NOT NULL DEFAULT 0,
+        tokens_charged INTEGER NOT NULL DEFAULT 0,
+        penalties INTEGER NOT NULL DEFAULT 0,
+        bonuses INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, role)
+    )''')
+    # Carry over what the users table already counted, replacing rows left by
+    # an earlier database
+    conn.execute('DELETE FROM user_usage')
+    conn.execute('''INSERT INTO user_usage (user_id, corrections, tokens_charged)
+                    SELECT id, COALESCE(total_corrections, 0), COALESCE(total_tokens_used, 0) FROM users''')
+
+def add_history_compression(conn):
+    # NULL means the texts are stored as plain text, 'zlib' as compressed blobs
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(correction_history)')}
+    if 'compression' not in columns:
+        conn.execute('ALTER TABLE correction_history ADD COLUMN compression TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_correction_history_user ON correction_history (user_id, id)')
+
+def create_bulk_import_progress(conn):
+    # Rows committed so far by each bulk import, so a failed one can resume, and
+    # the indexes it dropped, so they can be rebuilt even after a crash
+    conn.execute('''CREATE TABLE IF NOT EXISTS bulk_import_progress (
+        table_name TEXT NOT NULL,
+        source TEXT NOT NULL,
+        rows_done INTEGER NOT NULL DEFAULT 0,
+        dropped_indexes TEXT,
+        updated_at REAL,
+        PRIMARY KEY (table_name, source)
+    )''')
+
+def recount_user_usage(conn):
+    # users.total_tokens_used counted every debit, penalties included, and never
+    # took refunds back, so user_usage was seeded with the wrong figure. Recount
+    # it with the rules of user_manager.usage_deltas: debits and refunds are
+    # charges, penalties and bonuses have their own columns. Debits from before
+    # the ledger existed cannot be told apart and stay counted as charges.
+    conn.execute('DELETE FROM user_usage')
+    conn.execute('''INSERT INTO user_usage (user_id, corrections, tokens_charged, penalties, bonuses)
+                    SELECT u.id, COALESCE(u.total_corrections, 0),
+                           MAX(COALESCE(u.total_tokens_used, 0) - COALESCE(l.debits, 0), 0) + COALESCE(l.charged, 0),
+                           COALESCE(l.penalties, 0), COALESCE(l.bonuses, 0)
+                    FROM users u
+                    LEFT JOIN (SELECT user_id,
+                                      SUM(CASE WHEN amount < 0 THEN -amount ELSE 0 END) AS debits,
+                                      SUM(CASE WHEN reason IN ('insufficient tokens', 'complaint penalty',
+                                                               'rejected invitation', 'bonus') THEN 0
+                                               WHEN reason = 'refund' OR amount < 0 THEN -amount
+                                               ELSE 0 END) AS charged,
+                                      SUM(CASE WHEN reason IN ('insufficient tokens', 'complaint penalty',
+                                                               'rejected invitation') THEN -amount
+                                               ELSE 0 END) AS penalties,
+                                      SUM(CASE WHEN reason = 'bonus' THEN amount ELSE 0 END) AS bonuses
+                               FROM token_ledger GROUP BY user_id) l ON l.user_id = u.id''')
+
+# Applied in order; never edit a migration once it has shipped, add a new one
+MIGRATIONS = [
+    (1, 'base schema', create_base_schema),
+    (2, 'complaint and invitation indexes', add_complaint_and_invitation_indexes),
+    (3, 'collaboration and review indexes', add_collaboration_and_review_indexes),
+    (4, 'token ledger', create_token_ledger),
+    (5, 'listing indexes and counts', add_listing_indexes_and_counts),
+    (6, 'usage rollups', create_usage_rollups),
+    (7, 'correction history compression', add_history_compression),
+    (8, 'bulk import progress', create_bulk_import_progress),
+    (9, 'recount user usage', recount_user_usage)
+]
+
+def get_schema_version(conn) -> int:
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at REAL
+    )''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def migrate(conn) -> int:
+    """Apply pending migrations in one transaction and return the resulting schema version
+
+    The write lock is taken before the version is read, so two processes starting
+    together cannot apply the same migration twice.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = get_schema_version(conn)
+        for number, description, apply in MIGRATIONS:
+            if number > version:
+                apply(conn)
+                conn.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                             (number, description, time.time()))
+                version = number
+        conn.execute('COMMIT')
+    except sqlite3.Error:
+        conn.execute('ROLLBACK')
+        raise
+    return version
+
+if __name__ == '__main__':
+    from db import connect, DB_FILE
+    conn = connect(DB_FILE)
+    print(f"Schema version: {migrate(conn)}")
+    conn.close()
@@ -1,185 +1,257 @@
 import sqlite3
+import threading
+from collections import OrderedDict
 from typing import Optional
+from db import get_connection, get_writer
 import time
 import hashlib
 
-DB_PATH = 'database.db'
+# Most users kept in the process-wide user cache
+MAX_CACHED_USERS = 10000
+
+# Rows per page in the paginated listings
+DEFAULT_PAGE_SIZE = 25
+
+# Ledger reasons counted as penalties and bonuses in the usage rollups. Other
+# debits count as tokens charged, refunds give charged tokens back, and other
+# credits (purchases, adjustments) are not usage.
+PENALTY_REASONS = {'insufficient tokens', 'complaint penalty', 'rejected invitation'}
+BONUS_REASONS = {'bonus'}
+REFUND_REASONS = {'refund'}
 
 class User:
+    __slots__ = ('id', 'username', 'role', 'tokens')
+
     def __init__(self, user_id, username, role, tokens):
         self.id = user_id
         self.username = username
         self.role = role
         self.tokens = tokens
 
-# Database setup (run once)
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE,
-        password TEXT,
-        role TEXT,
-        tokens INTEGER,
-        last_login TIMESTAMP,
-        total_corrections INTEGER DEFAULT 0,
-        total_tokens_used INTEGER DEFAULT 0
-    )''')
-    
-    # Create table for correction history
-    c.execute('''CREATE TABLE IF NOT EXISTS correction_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        original_text TEXT,
-        corrected_text TEXT,
-        correction_type TEXT,
-        tokens_used INTEGER,
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )''')
-    
-    # Create table for rejected corrections
-    c.execute('''CREATE TABLE IF NOT EXISTS rejected_corrections (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        original_text TEXT,
-        rejected_correction TEXT,
-        reason TEXT,
-        status TEXT DEFAULT 'pending',
-        reviewed_by INTEGER,
-        review_timestamp TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id),
-        FOREIGN KEY (reviewed_by) REFERENCES users (id)
-    )''')
-    
-    conn.commit()
-    conn.close()
-
-def init_user_tables():
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
-    
-    # Create users table
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        role TEXT DEFAULT 'user',
-        tokens INTEGER DEFAULT 0,
-        last_login REAL,
-        total_corrections INTEGER DEFAULT 0,
-        total_tokens_used INTEGER DEFAULT 0
-    )''')
-    
-    # Create complaints table
-    c.execute('''CREATE TABLE IF NOT EXISTS complaints (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        complainer_id INTEGER NOT NULL,
-        complained_id INTEGER NOT NULL,
-        reason TEXT NOT NULL,
-        response TEXT,
-        status TEXT DEFAULT 'pending',
-        created_at REAL DEFAULT (strftime('%s', 'now')),
-        responded_at REAL,
-        resolved_at REAL,
-        action_taken TEXT,
-        penalty_tokens INTEGER DEFAULT 0,
-        penalty_user_id INTEGER,
-        FOREIGN KEY (complainer_id) REFERENCES users (id),
-        FOREIGN KEY (complained_id) REFERENCES users (id),
-        FOREIGN KEY (penalty_user_id) REFERENCES users (id)
-    )''')
-    
-    conn.commit()
-    conn.close()
+    def copy(self) -> 'User':
+        return User(self.id, self.username, self.role, self.tokens)
+
+# Cached users by id, plus a username index. Callers always get copies, so
+# changes they make to their User never leak into the cache.
+_users_by_id = OrderedDict()
+_user_ids_by_name = {}
+_user_cache_lock = threading.Lock()
+# Bumped by every invalidation, so a read that raced with a write is not cached
+_user_cache_generation = 0
+
+def _cached_user(user_id) -> Optional[User]:
+    with _user_cache_lock:
+        user = _users_by_id.get(user_id)
+        if user is None:
+            return None
+        _users_by_id.move_to_end(user_id)
+        return user.copy()
+
+def _load_user(column, value) -> Optional[User]:
+    with _user_cache_lock:
+        generation = _user_cache_generation
+    row = get_connection().execute(f'SELECT id, username, role, tokens FROM users WHERE {column} = ?',
+                                   (value,)).fetchone()
+    if not row:
+        return None
+    user = User(row[0], row[1], row[2], row[3])
+    with _user_cache_lock:
+        if generation == _user_cache_generation:
+            _users_by_id[user.id] = user
+            _user_ids_by_name[user.username] = user.id
+            if len(_users_by_id) > MAX_CACHED_USERS:
+                _, evicted = _users_by_id.popitem(last=False)
+                _user_ids_by_name.pop(evicted.username, None)
+    return user.copy()
+
+def invalidate_user(user_id):
+    """Drop a user from the cache; call once the write that changed them has committed"""
+    global _user_cache_generation
+    with _user_cache_lock:
+        _user_cache_generation += 1
+        user = _users_by_id.pop(user_id, None)
+        if user is not None:
+            _user_ids_by_name.pop(user.username, None)
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def signup(username, password):
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
     try:
-        c.execute('INSERT INTO users (username, password, role, tokens, last_login) VALUES (?, ?, ?, ?, ?)',
-                 (username, password, 'user', 0, time.time()))
-        conn.commit()
+        get_writer().execute('INSERT INTO users (username, password, role, tokens, last_login) VALUES (?, ?, ?, ?, ?)',
+                             (username, password, 'user', 0, time.time()))
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 def login(username, password):
-    conn = sqlite3.connect('llm_editor.db')
+    conn = get_connection()
     c = conn.cursor()
     c.execute('SELECT id, username, role, tokens FROM users WHERE username = ? AND password = ?', (username, password))
     row = c.fetchone()
     if row:
         # Check if user is terminated
         if row[2] == 'terminated':
-            conn.close()
             return None
-        c.execute('UPDATE users SET last_login = ? WHERE id = ?', (time.time(), row[0]))
-        conn.commit()
+        # Nothing reads last_login straight back, so there is no need to wait for the commit
+        get_writer().submit(lambda writer_conn: writer_conn.execute('UPDATE users SET last_login = ? WHERE id = ?',
+                                                                    (time.time(), row[0])))
         return User(row[0], row[1], row[2], row[3])
-    conn.close()
     return None
 
 def get_user(username):
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
-    c.execute('SELECT id, username, role, tokens FROM users WHERE username = ?', (username,))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        return User(row[0], row[1], row[2], row[3])
-    return None
+    user_id = _user_ids_by_name.get(username)
+    user = _cached_user(user_id) if user_id is not None else None
+    return user or _load_user('username', username)
 
-def update_tokens(user_id, amount):
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
-    c.execute('UPDATE users SET tokens = tokens + ?, total_tokens_used = total_tokens_used + ? WHERE id = ?',
-             (amount, abs(amount) if amount < 0 else 0, user_id))
-    conn.commit()
-    conn.close()
+def get_user_by_id(user_id):
+    return _cached_user(user_id) or _load_user('id', user_id)
+
+def usage_deltas(amount, reason) -> tuple:
+    """Return the (tokens_charged, penalties, bonuses) a ledger entry adds to the rollups"""
+    if reason in PENALTY_REASONS:
+        return 0, -amount, 0
+    if reason in BONUS_REASONS:
+        return 0, 0, amount
+    if reason in REFUND_REASONS:
+        return -amount, 0, 0
+    if amount < 0:
+        return -amount, 0, 0
+    return 0, 0, 0
+
+def apply_usage(conn, user_id, role, corrections=0, tokens_charged=0, penalties=0, bonuses=0):
+    """Add to the per-user and per-day rollups on conn; user_id may be None for anonymous use"""
+    deltas = (corrections, tokens_charged, penalties, bonuses)
+    if not any(deltas):
+        return
+    if user_id is not None:
+        conn.execute('''INSERT INTO user_usage (user_id, corrections, tokens_charged, penalties, bonuses)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            corrections = corrections + excluded.corrections,
+                            tokens_charged = tokens_charged + excluded.tokens_charged,
+                            penalties = penalties + excluded.penalties,
+                            bonuses = bonuses + excluded.bonuses''', (user_id,) + deltas)
+    conn.execute('''INSERT INTO daily_usage (day, role, corrections, tokens_charged, penalties, bonuses)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (day, role) DO UPDATE SET
+                        corrections = corrections + excluded.corrections,
+                        tokens_charged = tokens_charged + excluded.tokens_charged,
+                        penalties = penalties + excluded.penalties,
+                        bonuses = bonuses + excluded.bonuses''', (time.strftime('%Y-%m-%d'), role) + deltas)
+
+def apply_token_change(conn, user_id, amount, reason='adjustment') -> Optional[int]:
+    """Add amount to a user's tokens on conn and record it in the ledger and usage rollups
+
+    Spent tokens are counted in user_usage, see usage_deltas. Returns the new
+    balance, or None when the user does not exist.
+    """
+    conn.execute('UPDATE users SET tokens = tokens + ? WHERE id = ?', (amount, user_id))
+    row = conn.execute('SELECT tokens, role FROM users WHERE id = ?', (user_id,)).fetchone()
+    if not row:
+        return None
+    conn.execute('INSERT INTO token_ledger (user_id, amount, reason, balance, created_at) VALUES (?, ?, ?, ?, ?)',
+                 (user_id, amount, reason, row[0], time.time()))
+    tokens_charged, penalties, bonuses = usage_deltas(amount, reason)
+    apply_usage(conn, user_id, row[1], tokens_charged=tokens_charged, penalties=penalties, bonuses=bonuses)
+    return row[0]
+
+def record_correction(user_id, role):
+    """Count one completed correction for a user, or for an anonymous user of role when user_id is None"""
+    get_writer().write(lambda conn: apply_usage(conn, user_id, role, corrections=1))
+
+def charge(user_id, amount, reason) -> Optional[int]:
+    """Debit amount tokens if the balance covers it, in one transaction
+
+    Returns the new balance, or None when the balance is too low (nothing is
+    debited then).
+    """
+    def job(conn):
+        row = conn.execute('SELECT tokens FROM users WHERE id = ?', (user_id,)).fetchone()
+        if not row or row[0] < amount:
+            return None
+        return apply_token_change(conn, user_id, -amount, reason)
+    balance = get_writer().write(job)
+    invalidate_user(user_id)
+    return balance
+
+def charge_penalty(user_id, reason) -> tuple:
+    """Debit half of the current balance and return (penalty, new balance)"""
+    def job(conn):
+        row = conn.execute('SELECT tokens FROM users WHERE id = ?', (user_id,)).fetchone()
+        penalty = row[0] // 2 if row else 0
+        return penalty, apply_token_change(conn, user_id, -penalty, reason)
+    result = get_writer().write(job)
+    invalidate_user(user_id)
+    return result
+
+def credit(user_id, amount, reason) -> Optional[int]:
+    """Add amount tokens and return the new balance"""
+    balance = get_writer().write(lambda conn: apply_token_change(conn, user_id, amount, reason))
+    invalidate_user(user_id)
+    return balance
+
+def update_tokens(user_id, amount, reason='adjustment') -> Optional[int]:
+    return credit(user_id, amount, reason)
 
 def purchase_tokens(user_id, amount):
     if amount < 10:
         return False
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
-    c.execute('UPDATE users SET tokens = tokens + ? WHERE id = ?', (amount, user_id))
-    conn.commit()
-    conn.close()
+    credit(user_id, amount, 'purchase')
     return True
 
 def get_all_users():
-    conn = sqlite3.connect('llm_editor.db')
+    conn = get_connection()
     c = conn.cursor()
-    c.execute('''SELECT id, username, role, tokens, total_corrections, total_tokens_used 
-                 FROM users ORDER BY username''')
+    # Totals come from user_usage, the same figures get_user_statistics shows
+    c.execute('''SELECT u.id, u.username, u.role, u.tokens, COALESCE(s.corrections, 0), COALESCE(s.tokens_charged, 0)
+                 FROM users u LEFT JOIN user_usage s ON s.user_id = u.id
+                 ORDER BY u.username''')
     users = [{'id': row[0], 'username': row[1], 'role': row[2], 'tokens': row[3],
               'total_corrections': row[4], 'total_tokens_used': row[5]} for row in c.fetchall()]
-    conn.close()
     return users
 
+def list_users(role=None, after=None, limit=DEFAULT_PAGE_SIZE) -> tuple:
+    """Return one page of users in username order and the cursor for the next page
+
+    after is the cursor returned for the previous page (None for the first one);
+    the next cursor is None on the last page.
+    """
+    conditions, params = [], []
+    if role:
+        conditions.append('u.role = ?')
+        params.append(role)
+    if after is not None:
+        conditions.append('u.username > ?')
+        params.append(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    rows = get_connection().execute(f'''SELECT u.id, u.username, u.role, u.tokens,
+                                               COALESCE(s.corrections, 0), COALESCE(s.tokens_charged, 0)
+                                        FROM users u LEFT JOIN user_usage s ON s.user_id = u.id
+                                        {where}
+                                        ORDER BY u.username LIMIT ?''', params + [limit + 1]).fetchall()
+    users = [{'id': row[0], 'username': row[1], 'role': row[2], 'tokens': row[3],
+              'total_corrections': row[4], 'total_tokens_used': row[5]} for row in rows[:limit]]
+    next_cursor = users[-1]['username'] if len(rows) > limit else None
+    return users, next_cursor
+
+def count_users(role=None) -> int:
+    """Return the number of users, optionally with one role, from the trigger-maintained counts"""
+    if role:
+        row = get_connection().execute('SELECT count FROM user_role_counts WHERE role = ?', (role,)).fetchone()
+        return row[0] if row else 0
+    return get_connection().execute('SELECT COALESCE(SUM(count), 0) FROM user_role_counts').fetchone()[0]
+
 def suspend_user(user_id):
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
-    c.execute('UPDATE users SET role = ? WHERE id = ?', ('suspended', user_id))
-    conn.commit()
-    conn.close()
+    get_writer().execute('UPDATE users SET role = ? WHERE id = ?', ('suspended', user_id))
+    invalidate_user(user_id)
 
 def terminate_user(user_id):
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
-    c.execute('UPDATE users SET role = ? WHERE id = ?', ('terminated', user_id))
-    conn.commit()
-    conn.close()
+    get_writer().execute('UPDATE users SET role = ? WHERE id = ?', ('terminated', user_id))
+    invalidate_user(user_id)
 
 def get_pending_complaints():
-    conn = sqlite3.connect('llm_editor.db')
+    conn = get_connection()
     c = conn.cursor()
     c.execute('''SELECT c.id, c.complainer_id, c.complained_id, c.reason, c.created_at,
                         u1.username as complainer_username,
@@ -193,11 +265,10 @@ def get_pending_complaints():
                   'reason': row[3], 'created_at': row[4],
                   'complainer_username': row[5], 'complained_username': row[6]}
                  for row in c.fetchall()]
-    conn.close()
     return complaints
 
 def resolve_complaint(complaint_id, action, penalty=0):
-    conn = sqlite3.connect('llm_editor.db')
+    conn = get_connection()
     c = conn.cursor()
     try:
         c.execute('SELECT complained_id FROM complaints WHERE id = ?', (complaint_id,))
@@ -219,23 +290,40 @@ def resolve_complaint(complaint_id, action, penalty=0):
         conn.commit()
         return True
     except:
+        conn.rollback()
         return False
-    finally:
-        conn.close()
 
 def get_user_statistics(user_id: int) -> dict:
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
-    c.execute('''SELECT total_corrections, total_tokens_used, tokens 
-                 FROM users WHERE id = ?''', (user_id,))
+    c.execute('''SELECT COALESCE(s.corrections, 0), COALESCE(s.tokens_charged, 0), u.tokens,
+                        COALESCE(s.penalties, 0), COALESCE(s.bonuses, 0)
+                 FROM users u
+                 LEFT JOIN user_usage s ON s.user_id = u.id
+                 WHERE u.id = ?''', (user_id,))
     stats = c.fetchone()
-    conn.close()
+    if not stats:
+        return None
     return {
         'total_corrections': stats[0],
         'total_tokens_used': stats[1],
-        'current_tokens': stats[2]
+        'current_tokens': stats[2],
+        'penalties': stats[3],
+        'bonuses': stats[4]
     }
 
+def get_daily_usage(days: int = 30) -> list:
+    """Return per-day, per-role usage for the most recent days, newest first"""
+    conn = get_connection()
+    c = conn.cursor()
+    first_day = time.strftime('%Y-%m-%d', time.localtime(time.time() - (days - 1) * 86400))
+    c.execute('''SELECT day, role, corrections, tokens_charged, penalties, bonuses
+                 FROM daily_usage
+                 WHERE day >= ?
+                 ORDER BY day DESC, role''', (first_day,))
+    return [{'day': row[0], 'role': row[1], 'corrections': row[2], 'tokens_charged': row[3],
+             'penalties': row[4], 'bonuses': row[5]} for row in c.fetchall()]
+
 def is_super_user(user: User) -> bool:
     return user.role == 'super'
 
@@ -243,7 +331,7 @@ def is_paid_user(user: User) -> bool:
     return user.role == 'paid'
 
 def get_pending_rejected_corrections():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     c.execute('''
         SELECT r.id, r.user_id, r.original_text, r.rejected_correction, r.reason, r.status,
@@ -265,50 +353,16 @@ def get_pending_rejected_corrections():
             'username': row[6],
             'review_timestamp': row[7]
         })
-    conn.close()
     return rejections
 
-def handle_rejected_correction(rejection_id: int, status: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''UPDATE rejected_corrections 
-                 SET status = ?, reviewed_by = ?, review_timestamp = ? 
-                 WHERE id = ?''', 
-              (status, st.session_state['user'].id, time.time(), rejection_id))
-    conn.commit()
-    conn.close()
-
-def init_complaints_table():
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
-    
-    # Drop existing complaints table to ensure clean schema
-    c.execute('DROP TABLE IF EXISTS complaints')
-    
-    # Create complaints table with all required columns
-    c.execute('''CREATE TABLE IF NOT EXISTS complaints (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        complainer_id INTEGER NOT NULL,
-        complained_id INTEGER NOT NULL,
-        reason TEXT NOT NULL,
-        response TEXT,
-        status TEXT DEFAULT 'pending',
-        created_at REAL DEFAULT (strftime('%s', 'now')),
-        responded_at REAL,
-        resolved_at REAL,
-        action_taken TEXT,
-        penalty_tokens INTEGER DEFAULT 0,
-        penalty_user_id INTEGER,
-        FOREIGN KEY (complainer_id) REFERENCES users (id),
-        FOREIGN KEY (complained_id) REFERENCES users (id),
-        FOREIGN KEY (penalty_user_id) REFERENCES users (id)
-    )''')
-    
-    conn.commit()
-    conn.close()
+def handle_rejected_correction(rejection_id: int, status: str, reviewer_id: int):
+    get_writer().execute('''UPDATE rejected_corrections 
+                            SET status = ?, reviewed_by = ?, review_timestamp = ? 
+                            WHERE id = ?''', 
+                         (status, reviewer_id, time.time(), rejection_id))
 
 def submit_complaint(complainer_id: int, complained_username: str, reason: str) -> bool:
-    conn = sqlite3.connect('llm_editor.db')
+    conn = get_connection()
     c = conn.cursor()
     try:
         # Get complained user's ID
@@ -320,20 +374,17 @@ def submit_complaint(complainer_id: int, complained_username: str, reason: str)
         complained_id = row[0]
         
         # Insert complaint
-        c.execute('''INSERT INTO complaints 
-                    (complainer_id, complained_id, reason, status)
-                    VALUES (?, ?, ?, ?)''',
-                 (complainer_id, complained_id, reason, 'pending'))
-        conn.commit()
+        get_writer().execute('''INSERT INTO complaints 
+                                (complainer_id, complained_id, reason, status)
+                                VALUES (?, ?, ?, ?)''',
+                             (complainer_id, complained_id, reason, 'pending'))
         return True
     except Exception as e:
         print(f"Error submitting complaint: {e}")
         return False
-    finally:
-        conn.close()
 
 def get_user_complaints(user_id: int) -> list:
-    conn = sqlite3.connect('llm_editor.db')
+    conn = get_connection()
     c = conn.cursor()
     c.execute('''
         SELECT c.id, c.reason, c.response, c.status, c.created_at, c.responded_at,
@@ -349,82 +400,97 @@ def get_user_complaints(user_id: int) -> list:
                   'status': row[3], 'created_at': row[4], 'responded_at': row[5],
                   'complainer_username': row[6], 'complained_username': row[7]}
                  for row in c.fetchall()]
-    conn.close()
     return complaints
 
 def respond_to_complaint(complaint_id: int, response: str) -> bool:
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
     try:
-        c.execute('''UPDATE complaints 
-                    SET response = ?, responded_at = ?
-                    WHERE id = ?''',
-                 (response, time.time(), complaint_id))
-        conn.commit()
+        get_writer().execute('''UPDATE complaints 
+                                SET response = ?, responded_at = ?
+                                WHERE id = ?''',
+                             (response, time.time(), complaint_id))
         return True
     except Exception as e:
         print(f"Error responding to complaint: {e}")
         return False
-    finally:
-        conn.close()
 
 def resolve_complaint(complaint_id: int, action: str, penalty: int, penalty_user_id: int) -> bool:
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
-    try:
+    def job(conn):
         # Apply token penalty if specified
         if penalty > 0:
-            c.execute('UPDATE users SET tokens = tokens - ? WHERE id = ?',
-                     (penalty, penalty_user_id))
+            apply_token_change(conn, penalty_user_id, -penalty, 'complaint penalty')
         
-        c.execute('''UPDATE complaints 
-                    SET status = ?, resolved_at = ?, action_taken = ?,
-                        penalty_tokens = ?, penalty_user_id = ?
-                    WHERE id = ?''',
-                 ('resolved', time.time(), action, penalty, penalty_user_id, complaint_id))
-        
-        conn.commit()
+        conn.execute('''UPDATE complaints 
+                        SET status = ?, resolved_at = ?, action_taken = ?,
+                            penalty_tokens = ?, penalty_user_id = ?
+                        WHERE id = ?''',
+                     ('resolved', time.time(), action, penalty, penalty_user_id, complaint_id))
+
+    try:
+        get_writer().write(job)
+        if penalty > 0:
+            invalidate_user(penalty_user_id)
         return True
     except Exception as e:
         print(f"Error resolving complaint: {e}")
         return False
-    finally:
-        conn.close()
 
-def get_complaint_details(complaint_id: int) -> Optional[dict]:
-    conn = sqlite3.connect('llm_editor.db')
-    c = conn.cursor()
-    try:
-        c.execute('''
-            SELECT c.id, c.reason, c.response, c.status, c.created_at, c.responded_at,
-                   u1.username as complainer_username,
-                   u2.username as complained_username
-            FROM complaints c
-            JOIN users u1 ON c.complainer_id = u1.id
-            JOIN users u2 ON c.complained_id = u2.id
-            WHERE c.id = ?
-        ''', (complaint_id,))
-        row = c.fetchone()
-        if row:
-            return {
-                'id': row[0],
-                'reason': row[1],
-                'response': row[2],
-                'status': row[3],
-                'created_at': row[4],
-                'responded_at': row[5],
-                'complainer_username': row[6],
-                'complained_username': row[7]
-            }
-        return None
-    finally:
-        conn.close()
+def list_complaints(status='pending', after=None, limit=DEFAULT_PAGE_SIZE) -> tuple:
+    """Return one page of complaints with status, newest first, and the cursor for the next page
+
+    Rows carry the response and both usernames, so no per-complaint lookups are
+    needed. The cursor is a (created_at, id) pair, None on the last page.
+    """
+    params = [status]
+    keyset = ''
+    if after is not None:
+        keyset = 'AND (c.created_at, c.id) < (?, ?)'
+        params.extend(after)
+    rows = get_connection().execute(f'''
+        SELECT c.id, c.complainer_id, c.complained_id, c.reason, c.response, c.status,
+               c.created_at, c.responded_at, c.action_taken,
+               u1.username as complainer_username,
+               u2.username as complained_username
+        FROM complaints c
+        JOIN users u1 ON c.complainer_id = u1.id
+        JOIN users u2 ON c.complained_id = u2.id
+        WHERE c.status = ? {keyset}
+        ORDER BY c.created_at DESC, c.id DESC
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+    complaints = [{'id': row[0], 'complainer_id': row[1], 'complained_id': row[2], 'reason': row[3],
+                   'response': row[4], 'status': row[5], 'created_at': row[6], 'responded_at': row[7],
+                   'action_taken': row[8], 'complainer_username': row[9], 'complained_username': row[10]}
+                  for row in rows[:limit]]
+    next_cursor = (complaints[-1]['created_at'], complaints[-1]['id']) if len(rows) > limit else None
+    return complaints, next_cursor
 
-# Initialize all tables
-def init_all_tables():
-    init_db()
-    init_complaints_table()
-    init_user_tables()
+def count_complaints(status='pending') -> int:
+    """Return the number of complaints with status, from the trigger-maintained counts"""
+    row = get_connection().execute('SELECT count FROM complaint_status_counts WHERE status = ?', (status,)).fetchone()
+    return row[0] if row else 0
 
-# Initialize tables
-init_all_tables() 
\ No newline at end of file
+def get_complaint_details(complaint_id: int) -> Optional[dict]:
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT c.id, c.reason, c.response, c.status, c.created_at, c.responded_at,
+               u1.username as complainer_username,
+               u2.username as complained_username
+        FROM complaints c
+        JOIN users u1 ON c.complainer_id = u1.id
+        JOIN users u2 ON c.complained_id = u2.id
+        WHERE c.id = ?
+    ''', (complaint_id,))
+    row = c.fetchone()
+    if row:
+        return {
+            'id': row[0],
+            'reason': row[1],
+            'response': row[2],
+            'status': row[3],
+            'created_at': row[4],
+            'responded_at': row[5],
+            'complainer_username': row[6],
+            'complained_username': row[7]
+        }
+    return None